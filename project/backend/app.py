@@ -1,3 +1,4 @@
+import asyncio
 import datetime
 import os
 import sys
@@ -10,9 +11,10 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 
 from data.database.database_events import init_db, SessionLocal, MainEventORM, SubEventORM, UserLikeORM, UserGoingORM  # pylint: disable=import-error
-from services.event_pipeline import run_email_to_db_pipeline  # pylint: disable=import-error
+from services.event_pipeline import run_email_to_db_pipeline, collect_recommendation_batches  # pylint: disable=import-error
 from auth.routes import auth_router  # pylint: disable=import-error
 from auth.utils import get_current_user  # pylint: disable=import-error
 
@@ -22,6 +24,8 @@ from config import (  # pylint: disable=import-error
     EMAIL_PIPELINE_CRON_HOURS,
     EMAIL_PIPELINE_DEFAULT_LIMIT,
     LOG_PATH,
+    RECOMMENDATION_USE_BATCH_API,
+    RECOMMENDATION_BATCH_POLL_SECONDS,
 )
 
 # This file sets up the FastAPI application, including CORS settings,
@@ -212,9 +216,10 @@ async def startup_event():
     init_db()
 
     #2) Run pipeline once at startup to fetch initial emails
+    # In a worker thread, so the blocking pipeline does not stall the event loop
     try:
         print("Running initial email to DB pipeline...")
-        run_email_to_db_pipeline()
+        await asyncio.to_thread(run_email_to_db_pipeline)
     except Exception as e: # pylint: disable=broad-except
         print(f"Error during initial pipeline run: {e}")
 
@@ -228,6 +233,15 @@ async def startup_event():
         replace_existing = True,
     )
 
+    # Batch recommendations are only submitted by the pipeline; this job stores their results once finished
+    if RECOMMENDATION_USE_BATCH_API:
+        scheduler.add_job(
+            collect_recommendation_batches,
+            trigger = IntervalTrigger(seconds=RECOMMENDATION_BATCH_POLL_SECONDS),
+            id="recommendation_batch_job",
+            replace_existing = True,
+        )
+
     #4) Start the scheduler
     scheduler.start()
     print(f"Scheduler started, email download job scheduled for every {EMAIL_PIPELINE_CRON_HOURS} hours.")
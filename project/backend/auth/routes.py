@@ -49,6 +49,13 @@ auth_router = APIRouter(prefix="/api/auth", tags=["auth"])
 # Thread pool for running blocking operations (email sending)
 email_executor = ThreadPoolExecutor(max_workers=2)
 
+
+def _run_single_user_recommendations(user_id: int) -> dict:
+    """Generate recommendations for one user in its own session (runs in a worker thread)."""
+    with SessionLocal() as db:
+        return run_single_user_recommendations(db, user_id)
+
+
 @auth_router.post("/register", response_model=TokenResponse)
 async def register(user_data: UserCreate):
     """Register a new user."""
@@ -81,9 +88,9 @@ async def register(user_data: UserCreate):
             # Generate initial event recommendations for the new user
             user_id = new_user.user_id
             
-        # Run recommendations in a separate session to avoid conflicts
-        with SessionLocal() as db:
-            run_single_user_recommendations(db, user_id)
+        # Run recommendations in a separate session to avoid conflicts,
+        # in a worker thread so the blocking LLM call does not stall the event loop
+        await asyncio.to_thread(_run_single_user_recommendations, user_id)
             
         # Refresh user to get updated recommendations
         with SessionLocal() as db:
@@ -286,10 +293,10 @@ async def generate_recommendations(current_user: UserORM = Depends(get_current_u
     Generate event recommendations for the current user on-demand.
     This endpoint triggers the LLM to analyze the user's interests and recommend events.
     """
-    with SessionLocal() as db:
-        result = run_single_user_recommendations(db, current_user.user_id)
-        
-        if not result["success"]:
-            raise HTTPException(status_code=400, detail=result["message"])
-        
-        return result
+    # In a worker thread so the blocking LLM call does not stall the event loop
+    result = await asyncio.to_thread(_run_single_user_recommendations, current_user.user_id)
+
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["message"])
+
+    return result
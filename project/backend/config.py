@@ -51,8 +51,20 @@ EMAIL_TEMP_DIR = "data/temp_emails"
 # ----- LLM Configuration -----
 RECOGNITION_LLM_MODEL = "gemini-3-flash-preview" #Model used for event recognition and extraction
 #RECOGNITION_LLM_MODEL = "gemini-2.5-flash" #Model used for event recognition and extraction
+#RECOGNITION_LLM_MODEL = "gemini-2.0-flash-lite" #Higher RPM and lower latency; switch once extraction quality on the evaluation set is acceptable
 DUPLICATION_LLM_MODEL = "gemini-2.5-flash" #Model used for event duplication detection
 RECOMMENDATION_LLM_MODEL = "gpt-oss-120b" #Model used for event recommendation
+RECOMMENDATION_MAX_CONCURRENCY = 16 #Maximum number of recommendation LLM requests in flight at once
+RECOMMENDATION_USER_BATCH_SIZE = 15 #Number of users sent to the recommendation LLM in one request
+RECOMMENDATION_SHORTLIST_SIZE = 20 #Events per user kept by the keyword prefilter before the LLM call
+RECOMMENDATION_USE_BATCH_API = False #Run the scheduled recommendations through Gemini Batch Mode (about half the cost, results can take hours)
+RECOMMENDATION_BATCH_LLM_MODEL = "gemini-2.5-flash" #Model used for batch event recommendation
+RECOMMENDATION_BATCH_POLL_SECONDS = 60 #Seconds between batch job status checks
+RECOMMENDATION_STRATEGY = "llm" #"llm" or "embedding" (local sentence-transformers matching, requires sentence-transformers)
+RECOMMENDATION_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2" #Model used for the embedding strategy
+RECOMMENDATION_EMBEDDING_MIN_SCORE = 0.3 #Minimum cosine similarity for an embedding recommendation
+RECOMMENDATION_CACHE_SIZE = 4096 #Number of recommendation results kept in memory (all results are also stored in the database)
+RECOMMENDATION_CACHE_TTL_HOURS = 24 #Cached recommendations older than this are regenerated
 
 # Image keys for event categorization, with optional descriptions (can be empty).
 IMAGE_KEY_DESCRIPTIONS = {
@@ -1,5 +1,5 @@
 
-from sqlalchemy import create_engine, Column, Integer, String, Text, JSON, ForeignKey, UniqueConstraint, Boolean, event
+from sqlalchemy import create_engine, Column, Integer, String, Text, JSON, ForeignKey, UniqueConstraint, Boolean, DateTime, LargeBinary, event
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 import uuid
 
@@ -190,6 +190,44 @@ class UserGoingORM(Base):
     main_event = relationship("MainEventORM", back_populates="going_by_users", foreign_keys=[main_event_id])
     sub_event = relationship("SubEventORM", back_populates="going_by_users", foreign_keys=[sub_event_id])
 
+# Define the RecommendationCacheORM class which represents the "user_recommendation_cache" table in the database.
+# This table stores each user's latest recommendation results keyed by a hash of their interests and the events version,
+# so unchanged inputs do not need another LLM call.
+class RecommendationCacheORM(Base):
+    __tablename__ = "user_recommendation_cache"
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), nullable=False)
+    cache_key = Column(String, nullable=False)  # sha1 of the user's interests and the events version
+    event_ids = Column(JSON, nullable=False)  # List of recommended main_event IDs
+    created_at = Column(DateTime, nullable=False)  # UTC time the recommendations were generated
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "cache_key", name="unique_user_recommendation_cache_key"),
+    )
+
+
+# Define the EventEmbeddingORM class which represents the "event_embeddings" table in the database.
+# This table stores the sentence embedding of each main_event for the embedding recommendation strategy,
+# together with a hash of the embedded text, so only new or changed events need to be embedded again.
+class EventEmbeddingORM(Base):
+    __tablename__ = "event_embeddings"
+
+    # CASCADE means that if an event is deleted, its embedding is also deleted.
+    main_event_id = Column(String, ForeignKey("main_events.id", ondelete="CASCADE"), primary_key=True)
+    content_hash = Column(String, nullable=False)  # sha1 of the embedding model name and the embedded text
+    embedding = Column(LargeBinary, nullable=False)  # float32 vector as raw bytes
+
+
+# Define the RecommendationBatchJobORM class which represents the "recommendation_batch_jobs" table in the database.
+# This table keeps the submitted recommendation batch jobs until their results are stored, so jobs that
+# finish after a restart are still collected.
+class RecommendationBatchJobORM(Base):
+    __tablename__ = "recommendation_batch_jobs"
+
+    job_name = Column(String, primary_key=True)  # Gemini batch job name (batches/...)
+    chunks = Column(JSON, nullable=False)  # Request key -> list of user IDs in that request
+    created_at = Column(DateTime, nullable=False)  # UTC time the job was submitted
 
 
 # Function to initialize the database and create tables.
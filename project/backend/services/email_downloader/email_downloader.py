@@ -1,29 +1,24 @@
 
 import os
+import re
 import json
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+from email.parser import BytesParser
 from email.policy import default
 import warnings
 
 import imaplib
-import email
 import ssl
 from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
-from services.email_downloader.url_downloader import fetch_urls_for_email, format_url_content_block  # pylint: disable=import-error
+from services.email_downloader.url_downloader import fetch_urls_for_email, format_url_content_block, URL_FETCH_MAX_WORKERS  # pylint: disable=import-error
 from config import IMAP_HOST, IMAP_PORT, EMAIL_TEMP_DIR  # pylint: disable=import-error
 
 #I disable this warning because it doesn't affect our use case
 warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
 
-# Create temp email directory if it doesn't exist
-os.makedirs(EMAIL_TEMP_DIR, exist_ok=True)
-
-# Load credentials from secrets.json
-with open("secrets.json", "r", encoding="utf-8") as f:
-    secrets = json.load(f)
-
-USER = secrets["USER_ZDV"]       # ZDV Login
-PASSWORD = secrets["USER_PASSWORD"]  # ZDV password
+# Case-insensitive match, so the body does not need to be lowercased (copied) per email
+RUNDMAIL_FILTER_RE = re.compile(r"rundmail|wiwinews", re.IGNORECASE)
 
 # -------- Email download function --------
 def download_latest_emails(limit: int = 10) -> None:
@@ -32,10 +27,21 @@ def download_latest_emails(limit: int = 10) -> None:
     extract their plain text bodies (and URL contents), and save them as a combined all_emails.txt file.
     """
 
+    # Create temp email directory if it doesn't exist
+    # (done here rather than at import time, so importing this module has no side effects)
+    os.makedirs(EMAIL_TEMP_DIR, exist_ok=True)
+
+    # Load credentials from secrets.json
+    with open("secrets.json", "r", encoding="utf-8") as f:
+        secrets = json.load(f)
+
+    user = secrets["USER_ZDV"]       # ZDV Login
+    password = secrets["USER_PASSWORD"]  # ZDV password
+
     # ---- connect and login ----
     context = ssl.create_default_context()
     M = imaplib.IMAP4_SSL(IMAP_HOST, IMAP_PORT, ssl_context=context) # connect to server
-    M.login(USER, PASSWORD)
+    M.login(user, password)
     M.select("Inbox") # select inbox
 
     # ---- search and fetch emails ----
@@ -44,7 +50,8 @@ def download_latest_emails(limit: int = 10) -> None:
     all_uids = data[0].split() # list of all email UIDs
     uids = all_uids[-limit:] # get the latest `limit` UIDs
 
-    combined_chunks: List[str] = [] # List of email text blocks
+    rundmails: List[Tuple[int, str, str, str]] = [] # (index, subject, sender, body) of emails that pass the filter
+    parser = BytesParser(policy=default) # one parser for all emails
 
     # ---- process each email ----
     for i, uid in enumerate(uids, 1):
@@ -53,7 +60,7 @@ def download_latest_emails(limit: int = 10) -> None:
         # RFC822 gets the full raw email text
         typ, msg_data = M.fetch(uid, "(RFC822)")  # pylint: disable=unused-variable
         raw = msg_data[0][1] #[0] is the tuple, [1] is the raw email bytes
-        em = email.message_from_bytes(raw, policy=default) # parse email
+        em = parser.parsebytes(raw) # parse email
 
         # ---- extract plain text body ----
         text = None
@@ -91,28 +98,40 @@ def download_latest_emails(limit: int = 10) -> None:
         body = text or "[no text body]"
 
         # ---- filter for "Rundmail" emails ----
-        if ("rundmail" in body.lower()) or ("wiwinews" in body.lower()):
-            
-            # ---- fetch URL content for this email ----
-            print("")
-            print(f"[download_latest_emails] Processing email {i}: extracting URLs...")
-            url_contents = fetch_urls_for_email(body)
+        if RUNDMAIL_FILTER_RE.search(body):
+            rundmails.append((i, subject, sender, body))
+
+    # ---- logout from the email server ----
+    M.logout()
+
+    # ---- fetch URL content for all emails concurrently ----
+    # Fetching is network-bound, so the emails' URLs are fetched in parallel threads.
+    # map() keeps the results in the same order as the emails.
+    print("")
+    print(f"[download_latest_emails] Extracting URLs from {len(rundmails)} emails...")
+
+    with ThreadPoolExecutor(max_workers=URL_FETCH_MAX_WORKERS) as executor:
+        all_url_contents = list(executor.map(fetch_urls_for_email, [body for _, _, _, body in rundmails]))
+
+    # ---- delete old email .txt files ----
+    # Also removes msg_*.txt scratch files left behind by earlier runs
+    for fname in os.listdir(EMAIL_TEMP_DIR):
+        if fname.lower().endswith(".txt"):
+            try:
+                os.remove(os.path.join(EMAIL_TEMP_DIR, fname))
+            except OSError:
+                pass
+
+    # ---- stream each email block into all_emails.txt ----
+    all_path = os.path.join(EMAIL_TEMP_DIR, "all_emails.txt")
+
+    with open(all_path, "w", encoding="utf-8") as all_emails_file:
+        for idx, ((i, subject, sender, body), url_contents) in enumerate(zip(rundmails, all_url_contents)):
             url_content_block = format_url_content_block(url_contents)
             
             if url_contents:
                 print(f"[download_latest_emails] Fetched content from {len(url_contents)} URLs for email {i}")
             
-            # ---- save per-email .txt file ----
-            per_email_path = os.path.join(EMAIL_TEMP_DIR, f"msg_{i:04d}.txt")
-
-            # write to file including Subject and From headers for context
-            with open(per_email_path, "w", encoding="utf-8") as per_email_file:
-                per_email_file.write(f"Subject: {subject}\n")
-                per_email_file.write(f"From: {sender}\n\n")
-                per_email_file.write(body + "\n")
-                if url_content_block:
-                    per_email_file.write(url_content_block + "\n")
-
             # ---- prepare combined string for LLM to process ----
             # Include URL content right after the email body
             email_block = (
@@ -124,28 +143,10 @@ def download_latest_emails(limit: int = 10) -> None:
                 f"--------------- EMAIL: {i} End ---------------\n"
             )
 
-            # Append this email block to the list
-            combined_chunks.append(email_block)
-
-    # ---- logout from the email server ----
-    M.logout()
-
-    # --- combine all email blocks into one string ----
-    combined_string = "\n\n".join(combined_chunks)
-
-    # ---- delete old email .txt files ----
-    for fname in os.listdir(EMAIL_TEMP_DIR):
-        if fname.lower().endswith(".txt"):
-            try:
-                os.remove(os.path.join(EMAIL_TEMP_DIR, fname))
-            except OSError:
-                pass
-
-    # ---- save combined all_emails.txt file ----
-    all_path = os.path.join(EMAIL_TEMP_DIR, "all_emails.txt")
-
-    with open(all_path, "w", encoding="utf-8") as all_path_files:
-        all_path_files.write(combined_string)
+            # Write this email block straight to the combined file, separated by a blank line
+            if idx > 0:
+                all_emails_file.write("\n\n")
+            all_emails_file.write(email_block)
 
     # ---- print status ----
     print("")
@@ -15,6 +15,8 @@ URL_REQUEST_TIMEOUT = 10
 MAX_URLS_PER_EMAIL = 3
 # Maximum content length per URL (characters)
 MAX_CONTENT_LENGTH = 10000
+# Number of emails whose URLs are fetched in parallel
+URL_FETCH_MAX_WORKERS = 8
 
 # URL patterns to skip (social media, unsubscribe links, etc.)
 SKIP_URL_PATTERNS = [
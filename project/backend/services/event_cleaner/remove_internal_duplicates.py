@@ -1,10 +1,10 @@
 import json
 
-from google import genai
 from sqlalchemy.orm import Session
 
 from data.database.database_events import MainEventORM, SubEventORM # pylint: disable=import-error
 from config import RECOGNITION_LLM_MODEL  # pylint: disable=import-error
+from services.llm_clients import get_gemini_client  # pylint: disable=import-error
 
 # Schema for internal duplicate detection - returns list of duplicate group indices
 from google.genai import types
@@ -117,10 +117,7 @@ def call_llm_for_internal_duplicates(events_list: list, table_name: str) -> list
     ]
     """
     
-    with open("secrets.json", "r", encoding="utf-8") as f:
-        secrets = json.load(f)
-
-    client = genai.Client(api_key=secrets["GEMINI_API_KEY"])
+    client = get_gemini_client()
 
     response = client.models.generate_content(
         model=RECOGNITION_LLM_MODEL,
@@ -365,10 +362,7 @@ def call_llm_for_cross_table_duplicates(main_events: list, sub_events: list) ->
 
     """
     
-    with open("secrets.json", "r", encoding="utf-8") as f:
-        secrets = json.load(f)
-
-    client = genai.Client(api_key=secrets["GEMINI_API_KEY"])
+    client = get_gemini_client()
 
     response = client.models.generate_content(
         model=RECOGNITION_LLM_MODEL,
@@ -1,11 +1,11 @@
 import json
 from typing import List, Tuple, Dict, Any
 
-from google import genai
 from google.genai import types
 
 from data.database.database_events import MainEventORM, SubEventORM  # pylint: disable=import-error
 from config import DUPLICATION_LLM_MODEL  # pylint: disable=import-error
+from services.llm_clients import get_gemini_client  # pylint: disable=import-error
 
 # Define the expected schema for the LLM response for simple duplicate checking
 # It should be a list of objects with a single boolean field "is_new"
@@ -85,10 +85,7 @@ def call_llm_decisions(
     existing_events = {json.dumps(existing_summary, ensure_ascii=False, indent=2)}
     """
 
-    with open("secrets.json", "r", encoding="utf-8") as f:
-        secrets = json.load(f)
-
-    client = genai.Client(api_key=secrets["GEMINI_API_KEY"])
+    client = get_gemini_client()
 
     resp = client.models.generate_content(
         model=DUPLICATION_LLM_MODEL,
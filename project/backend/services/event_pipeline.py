@@ -8,7 +8,7 @@ from datetime import datetime
 from sqlalchemy.orm import Session
 
 from data.database.database_events import SessionLocal, MainEventORM, SubEventORM  # pylint: disable=import-error
-from config import EMAIL_TEMP_DIR, EMAIL_PIPELINE_DEFAULT_LIMIT  # pylint: disable=import-error
+from config import EMAIL_TEMP_DIR, EMAIL_PIPELINE_DEFAULT_LIMIT, RECOMMENDATION_USE_BATCH_API  # pylint: disable=import-error
 
 from services.email_downloader.email_downloader import download_latest_emails   # pylint: disable=import-error
 from services.event_duplicator import filter_new_main_events, filter_new_sub_events_with_correction  # pylint: disable=import-error
@@ -18,7 +18,7 @@ from services.event_cleaner.archive_past_events import filter_future_events_with
 from services.event_cleaner.cleanup_orphan_subevents import cleanup_orphan_sub_events  # pylint: disable=import-error
 from services.event_cleaner.remove_internal_duplicates import cleanup_internal_duplicates, cleanup_cross_table_duplicates  # pylint: disable=import-error
 
-from services.event_recommender import run_event_recommendations  # pylint: disable=import-error
+from services.event_recommender import run_event_recommendations, run_event_recommendations_batch, collect_event_recommendations_batch  # pylint: disable=import-error
 
 logging.getLogger("google_genai.types").setLevel(logging.ERROR)
 
@@ -149,7 +149,10 @@ def run_email_to_db_pipeline(limit: int = EMAIL_PIPELINE_DEFAULT_LIMIT, outdir:
     print("")
 
     with SessionLocal() as db:
-        run_event_recommendations(db)
+        if RECOMMENDATION_USE_BATCH_API:
+            run_event_recommendations_batch(db)
+        else:
+            run_event_recommendations(db)
         db.close()
 
     print("##############################################################################################")
@@ -159,6 +162,16 @@ def run_email_to_db_pipeline(limit: int = EMAIL_PIPELINE_DEFAULT_LIMIT, outdir:
     print("##############################################################################################")
 
 
+def collect_recommendation_batches() -> None:
+    """
+    Scheduled companion of step 9 with RECOMMENDATION_USE_BATCH_API: store the results of
+    recommendation batch jobs that have finished since the last check.
+    """
+    with SessionLocal() as db:
+        collect_event_recommendations_batch(db)
+        db.close()
+
+
 def insert_non_duplicate_events(db: Session, main_events_raw: List[dict], sub_events_raw: List[dict]) -> None:
     """
     Inserts events into DB, skipping duplicates based on a *single* batch LLM call.
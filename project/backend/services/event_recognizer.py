@@ -1,12 +1,38 @@
-import json
+import copy
+import hashlib
+import io
+import os
 import re
-from google import genai
+import textwrap
+import threading
+from collections import OrderedDict
+from typing import Iterator, List, Optional
 from google.genai import types
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+try:
+    import ijson  # optional: lets the debug streaming path parse events as they arrive
+except ImportError:
+    ijson = None
+
+# Set once the missing-ijson fallback has been reported, so it is only logged once per process
+_ijson_fallback_logged = False
 
 from config import IMAGE_KEYS, IMAGE_KEY_DESCRIPTIONS, RECOGNITION_LLM_MODEL  # pylint: disable=import-error
+from services.llm_clients import get_gemini_client  # pylint: disable=import-error
 
 # -------- LLM Event Extraction Settings --------
 
+# Set EVENT_RECOGNIZER_DEBUG=1 to stream the model's thought summaries to the console.
+# Thoughts are billed as output tokens, so production runs use a single non-streaming call.
+DEBUG_THINK = os.environ.get("EVENT_RECOGNIZER_DEBUG") == "1"
+
+# In-process cache of extraction results, keyed by a BLAKE2b digest of the email text.
+# Re-runs and retries on identical input then skip the LLM call entirely.
+EXTRACTION_CACHE_SIZE = 1024
+_extraction_cache: "OrderedDict[bytes, list]" = OrderedDict()
+_extraction_cache_lock = threading.Lock()
+
 # Schema for a single event object
 EVENT_SCHEMA = types.Schema(
     type=types.Type.OBJECT,
@@ -32,17 +58,13 @@ EVENT_SCHEMA = types.Schema(
         "URL": types.Schema(type=types.Type.STRING, nullable=True),
         "Registration_URL": types.Schema(type=types.Type.STRING, nullable=True),
         "Meeting_URL": types.Schema(type=types.Type.STRING, nullable=True),
-        "Image_Key": types.Schema(type=types.Type.STRING, nullable=True),
+        "Image_Key": types.Schema(type=types.Type.STRING, nullable=True, enum=IMAGE_KEYS),  # decoder can only emit known keys
         "Event_Type": types.Schema(type=types.Type.STRING, nullable=False),  # "main_event" or "sub_event"
         "Main_Event_Temp_Key": types.Schema(type=types.Type.STRING, nullable=False),  # Temporary key to link sub_events to main_event
     },
-    required=[
-        "Title", "Start_Date", "End_Date", "Start_Time", "End_Time",
-        "Description", "Location", "Street", "House_Number", "Zip_Code", 
-        "City", "Country", "Room", "Floor", "Language", "Speaker", "Organizer", 
-        "Registration_Needed", "URL", "Registration_URL", "Meeting_URL", 
-        "Image_Key", "Event_Type", "Main_Event_Temp_Key",
-    ],
+    # Only the fields needed to store and link an event are forced; omitted fields are read as null
+    # via .get() downstream, which saves the output tokens of emitting every null key.
+    required=["Title", "Event_Type", "Main_Event_Temp_Key"],
 )
 
 # Schema for multiple event objects (array of EVENT_SCHEMA)
@@ -51,68 +73,102 @@ SCHEMA_MULTI = types.Schema(
     items=EVENT_SCHEMA,
 )
 
-# -------- LOG Printing Helper Functions --------
-
-def normalize_thought(text: str) -> str:
-
-    t = text.replace("\r\n", "\n").replace("\r", "\n")     # normalize newlines
-    t = t.strip()     # trim leading/trailing whitespace/newlines
-    t = re.sub(r"\n\s*\n+", "\n" * 2, t) # Collapses blank lines: \n\s*\n ..
-    t = "\n".join(line.rstrip() for line in t.split("\n"))     # Removes trailing spaces per line
-
-    return t
 
-def format_gemini_thought(md: str) -> str:
+class ExtractedEvent(BaseModel):
+    """Pydantic mirror of EVENT_SCHEMA used to validate the LLM response."""
+    Title: Optional[str] = None
+    Start_Date: Optional[str] = None
+    End_Date: Optional[str] = None
+    Start_Time: Optional[str] = None
+    End_Time: Optional[str] = None
+    Description: Optional[str] = None
+    Location: Optional[str] = None
+    Street: Optional[str] = None
+    House_Number: Optional[str] = None
+    Zip_Code: Optional[str] = None
+    City: Optional[str] = None
+    Country: Optional[str] = None
+    Room: Optional[str] = None
+    Floor: Optional[str] = None
+    Language: Optional[str] = None
+    Speaker: Optional[str] = None
+    Organizer: Optional[str] = None
+    Registration_Needed: Optional[bool] = None
+    URL: Optional[str] = None
+    Registration_URL: Optional[str] = None
+    Meeting_URL: Optional[str] = None
+    Image_Key: Optional[str] = None
+    Event_Type: Optional[str] = None  # events with a missing type are dropped by the pipeline, not here
+    Main_Event_Temp_Key: Optional[str] = None
+
+
+# Compiled once; validate_json parses and validates in a single pydantic-core pass
+EVENT_LIST_ADAPTER = TypeAdapter(List[ExtractedEvent])
+
+
+def validate_events(data, from_json: bool = True) -> list | None:
     """
-    Convert Gemini thought summaries like:
-      **Title**
-      <blank>
-      Body...
-    into:
-      Title: Body...
-    with clean spacing.
+    Validate the LLM output (a JSON string or already decoded list) against ExtractedEvent.
+    Returns a list of plain dicts with every schema key present, or None if the output is invalid.
     """
-    t = md.replace("\r\n", "\n").replace("\r", "\n").strip()
+    try:
+        if from_json:
+            events = EVENT_LIST_ADAPTER.validate_json(data)
+        else:
+            events = EVENT_LIST_ADAPTER.validate_python(data)
+    except (ValidationError, TypeError) as e:
+        print("[event_recognizer] Failed to parse LLM JSON:", e)
+        return None
 
-    # Split into segments that start with **Title**
-    # Captures titles and their following text until next **Title** or end.
-    pattern = re.compile(r"\*\*(.+?)\*\*\s*\n+(.*?)(?=\n+\*\*.+?\*\*|\Z)", re.DOTALL)
+    return _dump_events(events)
 
-    parts = []
-    for title, body in pattern.findall(t):
-        title = title.strip()
-        body = body.strip()
 
-        # Collapse whitespace/newlines inside body to single spaces
-        body = re.sub(r"\s+", " ", body)
+def _dump_events(events: List[ExtractedEvent]) -> List[dict]:
+    return [event.model_dump() for event in events]
 
-        parts.append(f"{title}: {body}")
+# -------- LLM Prompt --------
 
-    # If nothing matched (unexpected format), just collapse whitespace and return
-    if not parts:
-        return re.sub(r"\s+", " ", t)
+def compact_prompt(text: str) -> str:
+    """
+    Dedent a prompt, strip trailing spaces and collapse runs of blank lines.
+    The indentation of the triple-quoted source would otherwise be sent (and billed) as input tokens.
+    """
+    t = textwrap.dedent(text).strip()
+    t = "\n".join(line.rstrip() for line in t.split("\n"))
+    return re.sub(r"\n{3,}", "\n\n", t)
 
-    # Separate formatted sections with a blank line (like your desired output)
-    return "\n\n".join(parts)
+# "(use other_key)" pointers inside the "Do not use for:" part of an image key description
+_IMAGE_KEY_REF_RE = re.compile(r"\(use ([^)]*)\)")
 
-def indent_block(text: str, prefix: str = "  ") -> str:
-    return "\n".join(prefix + line if line else prefix.rstrip() for line in text.split("\n"))
 
-#-------- LLM Event Extraction Function --------
-def extract_event_info_with_llm(email_text: str) -> dict:
+def compact_image_key_hint(desc: str) -> str:
     """
-    Use a Gemini LLM to extract structured event information from the provided email text.
+    Shorten an image key description for the prompt: keep the "Use for:" part and the
+    "If overlapping:" rule, and reduce the "Do not use for:" prose to the keys it points to.
+    Descriptions without these parts are returned unchanged.
     """
-    
-    # Generate image key strings for the prompt
-    image_keys_str = ", ".join(f'"{k}"' for k in IMAGE_KEYS)
-    image_key_descriptions_str = "\n".join(
-        f"- {key}: {desc if desc else '(no description provided)'}"
-        for key, desc in IMAGE_KEY_DESCRIPTIONS.items()
-    )
+    if not desc:
+        return "(no description provided)"
+
+    use_for, sep, rest = desc.partition(" Do not use for:")
+    do_not, sep2, overlap = rest.partition(" If overlapping:")
+    if not sep or not sep2:
+        return desc
+
+    refs = _IMAGE_KEY_REF_RE.findall(do_not)
+    otherwise = f" Otherwise: {'; '.join(refs)}." if refs else ""
+    return f"{use_for}{otherwise} If overlapping:{overlap}"
+
+
+# Image key hints for the prompt. The allowed values are enforced by the schema enum,
+# but the disambiguation rules between overlapping keys are kept in compact form.
+IMAGE_KEY_HINTS = "\n".join(
+    f"- {key}: {compact_image_key_hint(desc)}"
+    for key, desc in IMAGE_KEY_DESCRIPTIONS.items()
+)
 
-    # System instructions
-    system_instruction = f"""
+# System instructions (built once at import time)
+SYSTEM_INSTRUCTION = compact_prompt("""
 
     You are a multilingual assistant that extracts structured event information from university email texts. 
     The emails may be in various languages including English and German. One email might also include multiple languages. 
@@ -228,7 +284,7 @@ def extract_event_info_with_llm(email_text: str) -> dict:
     - URL (String or null): A URL for general information about the event if available. 
     - Registration_URL (String or null): A URL where users can register for the event if available.
     - Meeting_URL (String or null): A URL for online meetings (Zoom, Teams, etc.) if available.
-    - Image_Key (String or null): Choose one of the following image keys to represent the event: [ {image_keys_str} ]. Here are the image key descriptions that you should use to understand what each image key represents: {image_key_descriptions_str}
+    - Image_Key (String or null): Choose the image key that best represents the event: {image_key_hints}
     - Event_Type (String, REQUIRED): Must be either "main_event" or "sub_event". Use "main_event" for standalone events or parent events that have sub-events. Use "sub_event" for events that are part of a larger event series (e.g., individual talks in a lecture series, workshops in a conference, sessions in a multi-day event). 
     - Main_Event_Temp_Key (String, REQUIRED): A temporary identifier to link related events. For main_events, generate a unique short key (e.g., "conf2024", "lecture_series_ai"). For sub_events, use the SAME key as their parent main_event so they can be linked together. If an event is a standalone main_event with no sub_events, still provide a unique key. Sub events must have a corresponding main event with the same Main_Event_Temp_Key.
 
@@ -239,85 +295,223 @@ def extract_event_info_with_llm(email_text: str) -> dict:
     IV.6. Do NOT wrap any characters (such as German umlauts ä, ö, ü) in angle brackets like <ä> or <ü>.
     IV.7. Do NOT use XML-like or HTML-like tags in your output.
     IV.8. It it possible that one event happens over multiple days; In that case, save the dates and times in a list.
+""").format(image_key_hints=IMAGE_KEY_HINTS)
+
+# -------- LOG Printing Helper Functions --------
+
+def normalize_thought(text: str) -> str:
+
+    t = text.replace("\r\n", "\n").replace("\r", "\n")     # normalize newlines
+    t = t.strip()     # trim leading/trailing whitespace/newlines
+    t = re.sub(r"\n\s*\n+", "\n" * 2, t) # Collapses blank lines: \n\s*\n ..
+    t = "\n".join(line.rstrip() for line in t.split("\n"))     # Removes trailing spaces per line
+
+    return t
+
+def format_gemini_thought(md: str) -> str:
+    """
+    Convert Gemini thought summaries like:
+      **Title**
+      <blank>
+      Body...
+    into:
+      Title: Body...
+    with clean spacing.
     """
+    t = md.replace("\r\n", "\n").replace("\r", "\n").strip()
 
-    # User prompt with the email text (URL content is already inline with each email)
-    user_prompt = f"""
+    # Split into segments that start with **Title**
+    # Captures titles and their following text until next **Title** or end.
+    pattern = re.compile(r"\*\*(.+?)\*\*\s*\n+(.*?)(?=\n+\*\*.+?\*\*|\Z)", re.DOTALL)
 
-    Extract event information from the following email text:
+    parts = []
+    for title, body in pattern.findall(t):
+        title = title.strip()
+        body = body.strip()
+
+        # Collapse whitespace/newlines inside body to single spaces
+        body = re.sub(r"\s+", " ", body)
+
+        parts.append(f"{title}: {body}")
 
-    {email_text}
+    # If nothing matched (unexpected format), just collapse whitespace and return
+    if not parts:
+        return re.sub(r"\s+", " ", t)
+
+    # Separate formatted sections with a blank line (like your desired output)
+    return "\n\n".join(parts)
+
+def indent_block(text: str, prefix: str = "  ") -> str:
+    # textwrap.indent leaves blank lines untouched, so they carry no trailing whitespace
+    return textwrap.indent(text, prefix)
+
+#-------- LLM Event Extraction Function --------
+def extract_event_info_with_llm(email_text: str, debug: bool = DEBUG_THINK) -> dict:
+    """
+    Use a Gemini LLM to extract structured event information from the provided email text.
+    If debug is True, the response is streamed and the model's thoughts are printed.
+    Results for identical email text are served from an in-process LRU cache.
     """
+    key = hashlib.blake2b(email_text.encode("utf-8"), digest_size=16).digest()
+
+    with _extraction_cache_lock:
+        cached = _extraction_cache.get(key)
+        if cached is not None:
+            _extraction_cache.move_to_end(key)
 
-    # Combine system instruction and user prompt
-    contents = f"{system_instruction}\n\n{user_prompt}"
+    # Return copies, callers modify the event dicts in place
+    if cached is not None:
+        print("[event_recognizer] Using cached extraction result for identical email text.")
+        return copy.deepcopy(cached)
 
-    # Load Gemini API key from secrets.json
-    with open("secrets.json", "r", encoding="utf-8") as f:
-        secrets = json.load(f)
+    events = _extract_event_info_uncached(email_text, debug)
 
-    # Create Gemini client
-    client = genai.Client(api_key=secrets["GEMINI_API_KEY"])
+    # Failed parses are not cached so the next run retries the LLM
+    if events is not None:
+        with _extraction_cache_lock:
+            _extraction_cache[key] = copy.deepcopy(events)
+            if len(_extraction_cache) > EXTRACTION_CACHE_SIZE:
+                _extraction_cache.popitem(last=False)
 
-    answer_parts = []
+    return events
 
-    stream = client.models.generate_content_stream(
+
+def _extract_event_info_uncached(email_text: str, debug: bool) -> dict:
+    """
+    Call the LLM for the given email text without consulting the cache.
+    """
+    # Debug path: stream the response (with thoughts) and materialize the generator
+    if debug:
+        try:
+            return list(iter_event_info_with_llm(email_text, debug=True))
+        except ValueError as e:
+            print("[event_recognizer] Failed to parse LLM JSON:", e)
+            return None
+
+    # Production path: one non-streaming call without thought summaries
+    resp = get_gemini_client().models.generate_content(
         model=RECOGNITION_LLM_MODEL,
-        contents=contents,
+        contents=_build_contents(email_text),
         config=types.GenerateContentConfig(
             response_mime_type="application/json",
             response_schema=SCHEMA_MULTI,
-            thinking_config=types.ThinkingConfig(
-                include_thoughts=True,
-            ),
         ),
     )
-    
-    last_thought = None
 
-    print(RECOGNITION_LLM_MODEL + " starts thinking ...")
-    print("")
+    return validate_events(resp.text)
+
+
+def iter_event_info_with_llm(email_text: str, debug: bool = DEBUG_THINK) -> Iterator[dict]:
+    """
+    Stream the LLM response and yield each event dict as soon as its JSON object is complete,
+    so downstream work can start while the model is still generating.
+    With ijson missing, the events are yielded once the full response has arrived.
+    If debug is True, the model's thoughts are requested and printed.
+    Raises ValueError if the response is not a valid event array.
+    """
+    global _ijson_fallback_logged  # pylint: disable=global-statement
+
+    answer_buf = io.StringIO()
+
+    if ijson is None and not _ijson_fallback_logged:
+        print("[event_recognizer] ijson is not installed; events are yielded only after the full response has arrived.")
+        _ijson_fallback_logged = True
+
+    # With ijson installed, the JSON array is parsed incrementally while the answer is still streaming
+    events = ijson.sendable_list() if ijson else None
+    parser = ijson.items_coro(events, "item", use_float=True) if ijson else None
+
+    stream = get_gemini_client().models.generate_content_stream(
+        model=RECOGNITION_LLM_MODEL,
+        contents=_build_contents(email_text),
+        config=types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=SCHEMA_MULTI,
+            thinking_config=types.ThinkingConfig(include_thoughts=True) if debug else None,
+        ),
+    )
+
+    last_thought_hash = None
+
+    if debug:
+        print(RECOGNITION_LLM_MODEL + " starts thinking ...")
+        print("")
 
     for chunk in stream:
 
-        # Some chunks may not contain candidates
-        if not getattr(chunk, "candidates", None):
+        # Some chunks may not contain candidates (the SDK models always define the attributes)
+        candidates = chunk.candidates
+        if not candidates:
+            continue
+
+        content = candidates[0].content
+        if content is None or not content.parts:
             continue
 
         # Process each part
-        for part in chunk.candidates[0].content.parts:
+        for part in content.parts:
+            text = part.text
 
             # Skip parts with no text
-            if not getattr(part, "text", None):
+            if not text:
                 continue
 
             # Printing thoughts
-            if getattr(part, "thought", False):
-                raw = part.text
+            if part.thought:
+                if not debug:
+                    continue
 
                 # Normalize the thought text
-                normalized_thought = format_gemini_thought(raw)
+                normalized_thought = format_gemini_thought(text)
 
-                 # Skip duplicate thoughts and empty thoughts
-                if not normalized_thought or normalized_thought == last_thought:
+                if not normalized_thought:
                     continue
 
-                last_thought = normalized_thought
+                # Skip duplicate thoughts (compare hashes instead of the full text)
+                thought_hash = hash(normalized_thought)
+                if thought_hash == last_thought_hash:
+                    continue
+
+                last_thought_hash = thought_hash
 
                 # Indent and print the thought block
                 print(indent_block(normalized_thought, prefix="    "))  # 4-space indent
                 print("")
+                continue
 
-            # Collect answer parts
-            else:
-                # Actual answer (JSON text) arrives here
-                answer_parts.append(part.text)
+            # Actual answer (JSON text) arrives here
+            if parser is None:
+                answer_buf.write(text)
+                continue
 
-    # Parse and return the JSON response in the format of a list of dicts (Exp: [{"Title": "...", "Start_Date": "...", ...}, {...}, ...])
-    try:
-        final_json_str = "".join(answer_parts)
+            try:
+                parser.send(text.encode("utf-8"))
+            except ijson.JSONError as e:
+                raise ValueError(str(e)) from e
 
-        return json.loads(final_json_str)
-    except json.JSONDecodeError as e:
-        print("[event_recognizer] Failed to parse LLM JSON:", e)
-        return None
\ No newline at end of file
+            # Yield the events whose JSON objects were closed by this chunk
+            if events:
+                yield from _dump_events(EVENT_LIST_ADAPTER.validate_python(events))
+                del events[:]
+
+    if parser is not None:
+        try:
+            parser.close()
+        except ijson.JSONError as e:
+            raise ValueError(str(e)) from e
+
+        yield from _dump_events(EVENT_LIST_ADAPTER.validate_python(events))
+        return
+
+    # Without ijson: parse the buffered response in one pass (list of dicts, Exp: [{"Title": "...", ...}, {...}, ...])
+    yield from _dump_events(EVENT_LIST_ADAPTER.validate_json(answer_buf.getvalue()))
+
+
+def _build_contents(email_text: str) -> str:
+    """
+    Combine the system instruction with the user prompt for the given email text.
+    """
+    # User prompt with the email text (URL content is already inline with each email)
+    user_prompt = f"Extract event information from the following email text:\n\n{email_text}"
+
+    return f"{SYSTEM_INSTRUCTION}\n\n{user_prompt}"
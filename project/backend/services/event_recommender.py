@@ -1,17 +1,58 @@
+import asyncio
+import hashlib
 import json
-from typing import Dict, List
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 import textwrap
-#from google import genai
-from openai import OpenAI
+import openai
+from openai import AsyncOpenAI
+from sqlalchemy import func, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 
-from data.database.database_events import UserORM, MainEventORM  # pylint: disable=import-error
-from config import RECOMMENDATION_LLM_MODEL  # pylint: disable=import-error
+try:
+    import orjson  # optional: faster JSON serialization of the prompts and parsing of the LLM answers
+except ImportError:
+    orjson = None
+
+from data.database.database_events import (  # pylint: disable=import-error
+    UserORM,
+    MainEventORM,
+    RecommendationCacheORM,
+    EventEmbeddingORM,
+    RecommendationBatchJobORM,
+)
+from services.llm_clients import (  # pylint: disable=import-error
+    OPENROUTER_BASE_URL,
+    create_async_http_client,
+    get_gemini_client,
+    get_openrouter_client,
+    load_secrets,
+)
+from config import (  # pylint: disable=import-error
+    RECOMMENDATION_BATCH_LLM_MODEL,
+    RECOMMENDATION_CACHE_SIZE,
+    RECOMMENDATION_CACHE_TTL_HOURS,
+    RECOMMENDATION_EMBEDDING_MIN_SCORE,
+    RECOMMENDATION_EMBEDDING_MODEL,
+    RECOMMENDATION_LLM_MODEL,
+    RECOMMENDATION_MAX_CONCURRENCY,
+    RECOMMENDATION_SHORTLIST_SIZE,
+    RECOMMENDATION_STRATEGY,
+    RECOMMENDATION_USER_BATCH_SIZE,
+)
 
 
 #   Event Recommender Service
 #
-#   This service uses an LLM (Gemini) to recommend events to users based on their
+#   This service uses an LLM (via OpenRouter) to recommend events to users based on their
 #   provided interests (interest_keys and interest_text columns in the users table).
 #
 #   The recommendation process:
@@ -23,6 +64,121 @@ from config import RECOMMENDATION_LLM_MODEL  # pylint: disable=import-error
 # Maximum number of events to recommend per user
 MAX_RECOMMENDATIONS_PER_USER = 3
 
+# Code fences around the JSON answer, which some models add despite the instructions
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+
+# Sentence embedding model for the "embedding" strategy, loaded on first use
+_embedding_model = None
+
+# In-process LRU in front of the user_recommendation_cache table: (user_id, cache_key) -> (event IDs, created_at)
+_recommendation_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_recommendation_cache_lock = threading.Lock()
+
+# Batch job states after which polling stops
+BATCH_FINAL_STATES = {
+    "JOB_STATE_SUCCEEDED",
+    "JOB_STATE_PARTIALLY_SUCCEEDED",
+    "JOB_STATE_FAILED",
+    "JOB_STATE_CANCELLED",
+    "JOB_STATE_EXPIRED",
+}
+
+# The system instruction is identical for every call, so it is built once at import.
+# We are using textwrap.dedent to format the multi-line string properly with
+# {{"user_id": 1, "recommended_event_ids": [5, 12, 3]}}, without confusing the syntax. 
+RECOMMENDATION_SYSTEM_INSTRUCTION = textwrap.dedent(
+    """
+    You are an event recommendation system. Your task is to match university events
+    to users based on their stated interests and preferred language.
+
+    You will receive:
+    1. A dictionary of USERS with their user_id as key and their interests as value.
+       Interests include "interest_keys" (list of keywords), "interest_text" (free text description of the users interest), and "language_preference" (preferred language).
+    2. A dictionary of EVENTS with event_id as key and event info (title, description, language) as value.
+
+    Your task:
+    - For each user, analyze their interests and find up to {max_events} events
+      that best match their interests and preferred language.
+    - Consider both the interest keywords, the free text description, and the preferred language when matching.
+    - Only recommend events that are genuinely relevant to the user's interests.
+    - If multiple events are equally relevant, prioritize those that match the user's preferred language.
+    - If no events match a user's preferred language, still recommend the most relevant events regardless of language.
+    - If no events match a user's interests very well, recommend fewer or no events for that user.
+
+    OUTPUT FORMAT:
+    Return a JSON ARRAY where each item is an object with:
+    - user_id (integer)
+    - recommended_event_ids (array of integers)
+    - Maximum {max_events} events per user
+    - Order events by relevance (most relevant first)
+
+    Example output:
+    [
+        {{"user_id": 1, "recommended_event_ids": [5, 12, 3]}},
+        {{"user_id": 2, "recommended_event_ids": [7]}},
+        {{"user_id": 3, "recommended_event_ids": [12, 5]}}
+    ]
+
+    If a user has no good matches, you can return an empty array for them, or omit them entirely.
+    """
+).format(max_events=MAX_RECOMMENDATIONS_PER_USER)
+
+# Rule-based compression of event descriptions before they are sent to the LLM.
+# Removes greetings, sign-offs, markdown and filler phrases that carry no information for matching.
+_SIGNATURE_RE = re.compile(
+    r"\n\s*(?:best regards|kind regards|regards|sincerely|cheers|best wishes|"
+    r"viele grüße|beste grüße|liebe grüße|mit freundlichen grüßen)\b.*$",
+    re.IGNORECASE | re.DOTALL,
+)
+# Only a first line that is nothing but a greeting ending in a comma ("Liebe Studierende,\n")
+_GREETING_RE = re.compile(
+    r"\A\s*(?:dear|hello|hi|liebe[rs]?|sehr geehrte[rn]?|hallo)\b[^\n]*,[ \t]*\n",
+    re.IGNORECASE,
+)
+_MARKDOWN_LINK_RE = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+# Paired markup only (**bold**, `code`); lone asterisks as in "Student*innen" or "a*b" stay
+_MARKDOWN_PAIRED_RE = re.compile(r"\*\*(\S(?:[^\n]*?\S)?)\*\*|`([^`\n]+)`")
+_MARKDOWN_LINE_RE = re.compile(r"^[ \t]*(?:#{1,6}|>)[ \t]+", re.MULTILINE)
+# Multi-word hedges only; single words like "please" or "bitte" can be part of the content
+_FILLER_RE = re.compile(
+    r"\b(?:it seems(?: that)?|i believe(?: that)?|feel free to|do not hesitate to|don't hesitate to|"
+    r"we would like to|we are (?:happy|pleased|delighted) to)\b,?\s*",
+    re.IGNORECASE,
+)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Word tokens for the keyword shortlist, ignoring the most common English and German stopwords
+_TOKEN_RE = re.compile(r"\w+")
+_STOPWORDS = {
+    "and", "the", "for", "with", "from", "are", "you", "your", "this", "that", "will", "all", "can", "not",
+    "und", "der", "die", "das", "mit", "für", "von", "ein", "eine", "den", "dem", "ist", "sie", "auf", "sich",
+}
+
+
+def _caveman(text: str) -> str:
+    """
+    Compress a description for the LLM prompt: drop greeting line, signature, markdown and
+    filler phrases, and collapse whitespace. Content words are kept as they are.
+
+    >>> _caveman("Hello World: an intro to programming, week 1")
+    'Hello World: an intro to programming, week 1'
+    >>> _caveman("Liebe Studierende und Mitarbeitende der Fakultät, lernen Sie Python.")
+    'Liebe Studierende und Mitarbeitende der Fakultät, lernen Sie Python.'
+    >>> _caveman("Workshop für Student*innen: a*b, please bring laptops")
+    'Workshop für Student*innen: a*b, please bring laptops'
+    >>> _caveman("Liebe Studierende,\\n**Python** Kurs, bitte `pip` installieren.\\n\\nViele Grüße\\nTeam")
+    'Python Kurs, bitte pip installieren.'
+    >>> _caveman("It seems that the talk on [LLMs](https://x.org) is full.")
+    'the talk on LLMs is full.'
+    """
+    text = _SIGNATURE_RE.sub("", text)
+    text = _GREETING_RE.sub("", text)
+    text = _MARKDOWN_LINK_RE.sub(r"\1", text)
+    text = _MARKDOWN_PAIRED_RE.sub(lambda m: m.group(1) or m.group(2), text)
+    text = _MARKDOWN_LINE_RE.sub("", text)
+    text = _FILLER_RE.sub("", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
 
 def get_users_with_interests(db: Session) -> Dict[int, dict]:
     """
@@ -38,19 +194,28 @@ def get_users_with_interests(db: Session) -> Dict[int, dict]:
             }
         }
     """
-    users = db.query(UserORM).all()
+    # Only load the columns we need, and let the database drop users without any interests
+    users = (
+        db.query(UserORM.user_id, UserORM.interest_keys, UserORM.interest_text, UserORM.language_preference)
+        .filter(or_(
+            func.json_array_length(UserORM.interest_keys) > 0,
+            func.length(func.trim(UserORM.interest_text)) > 0,
+        ))
+        .all()
+    )
     users_dict = {}
     
-    for user in users:
+    for user_id, interest_keys, interest_text, language_preference in users:
         # Only include users with at least one interest field populated
-        has_keys = user.interest_keys and len(user.interest_keys) > 0
-        has_text = user.interest_text and len(user.interest_text.strip()) > 0
+        # (SQLite's trim only removes spaces, so whitespace-only text is checked here)
+        has_keys = interest_keys and len(interest_keys) > 0
+        has_text = interest_text and len(interest_text.strip()) > 0
         
         if has_keys or has_text:
-            users_dict[user.user_id] = {
-                "interest_keys": user.interest_keys or [],
-                "interest_text": user.interest_text or "",
-                "language_preference": user.language_preference or "User doesn't have a specific language preference"
+            users_dict[user_id] = {
+                "interest_keys": interest_keys or [],
+                "interest_text": interest_text or "",
+                "language_preference": language_preference or "User doesn't have a specific language preference"
             }
     
     return users_dict
@@ -71,22 +236,156 @@ def get_events_for_recommendation(db: Session) -> Dict[int, dict]:
         }
     """
     # Only query non-archived main_events, not sub_events
-    events = db.query(MainEventORM).filter(MainEventORM.archived_event == False).all()
+    # Only load the columns that are sent to the recommender
+    events = (
+        db.query(MainEventORM.id, MainEventORM.title, MainEventORM.description, MainEventORM.language)
+        .filter(MainEventORM.archived_event == False)
+        .all()
+    )
     events_dict = {}
     
-    for event in events:
-        events_dict[event.id] = {
-            "title": event.title or "",
-            "description": event.description or "",
-            "language": event.language or "Event doesn't have a specific language"
+    for event_id, title, description, language in events:
+        events_dict[event_id] = {
+            "title": title or "",
+            "description": _caveman(description or ""),
+            "language": language or "Event doesn't have a specific language"
         }
     
     return events_dict
 
 
+def dump_prompt_json(payload) -> str:
+    """
+    Serialize a prompt payload as compact JSON (no indentation, non-ASCII kept as is),
+    which costs fewer tokens. Uses orjson when available; both paths give the same text.
+    """
+    if orjson:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def build_recommendation_messages(
+    users_dict: Dict[int, dict],
+    events_json: str,
+    system_instruction: str = RECOMMENDATION_SYSTEM_INSTRUCTION,
+) -> List[dict]:
+    """
+    Build the chat messages for matching the given users to the events in `events_json`
+    (the already serialized events dictionary, shared by all calls of one run).
+
+    The system instruction and the events block come first and are byte-identical for
+    every call of a run, so providers with prefix caching can reuse them across calls.
+    Only the last message depends on the users.
+    """
+    events_block = {"type": "text", "text": f"EVENTS (available for recommendation):\n{events_json}"}
+
+    # Anthropic models on OpenRouter only cache prompt parts that are explicitly marked
+    if RECOMMENDATION_LLM_MODEL.startswith("anthropic/"):
+        events_block["cache_control"] = {"type": "ephemeral"}
+
+    user_prompt = textwrap.dedent(
+        """
+        USERS (with their interests and preferred language):
+        {users_json}
+
+        Based on the users' interests, recommend the most relevant events for each user.
+        Return ONLY the JSON array with recommendation objects, no additional text.
+        """
+    ).format(users_json=dump_prompt_json(users_dict))
+
+    return [
+        {"role": "system", "content": system_instruction},
+        {"role": "system", "content": [events_block]},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def parse_recommendations(raw_content: str, events_dict: Dict[int, dict]) -> Dict[int, List[int]]:
+    """
+    Parse the LLM's JSON answer into {user_id: [event_id1, event_id2, ...]}.
+    Unknown event IDs are dropped and each list is limited to MAX_RECOMMENDATIONS_PER_USER.
+    Raises ValueError if the answer is not valid JSON.
+    """
+    # Defensive cleanup: strip possible ```json ... ``` or ``` ... ``` fences if the model ignores instructions
+    cleaned = _FENCE_RE.sub("", raw_content).strip()
+
+    # Parse JSON (orjson.JSONDecodeError is a ValueError as well)
+    recommendations_list = orjson.loads(cleaned) if orjson else json.loads(cleaned)
+
+    recommendations: Dict[int, List[int]] = {}
+
+    # Loop over recommendations
+    for item in recommendations_list:
+        # Validate item structure
+        if not isinstance(item, dict):
+            continue
+
+        user_id = item.get("user_id")
+        event_ids = item.get("recommended_event_ids", [])
+
+        if user_id is None:
+            continue
+
+        # Validate event IDs exist and limit to max recommendations
+        valid_event_ids = [
+            eid for eid in event_ids
+            if eid in events_dict
+        ][:MAX_RECOMMENDATIONS_PER_USER]
+
+        # Only add if there are valid recommendations
+        recommendations[int(user_id)] = valid_event_ids
+
+    return recommendations
+
+
+# Retry transient OpenRouter failures (rate limits, timeouts, connection errors, 5xx)
+# with exponential backoff and jitter, instead of losing the users' recommendations until the next run
+_llm_retry = retry(
+    wait=wait_exponential_jitter(initial=0.5, max=10),
+    stop=stop_after_attempt(5),
+    retry=retry_if_exception_type((openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)),
+    reraise=True,
+)
+
+# On-demand requests (registration, "generate recommendations") have a user waiting,
+# so they get one short retry instead of the full backoff of the scheduled pipeline
+_llm_retry_on_demand = retry(
+    wait=wait_exponential_jitter(initial=0.5, max=2),
+    stop=stop_after_attempt(2),
+    retry=retry_if_exception_type((openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)),
+    reraise=True,
+)
+
+
+@_llm_retry_on_demand
+def _create_completion(client, messages: List[dict]):
+    """
+    Call the recommendation model with the given messages (retried once on transient errors).
+    """
+    return client.chat.completions.create(
+        model=RECOMMENDATION_LLM_MODEL,
+        messages=messages,
+        extra_body={"reasoning": {"enabled": True}},
+    )
+
+
+@_llm_retry
+async def _create_completion_async(client: AsyncOpenAI, messages: List[dict]):
+    """
+    Async variant of _create_completion.
+    """
+    return await client.chat.completions.create(
+        model=RECOMMENDATION_LLM_MODEL,
+        messages=messages,
+        extra_body={"reasoning": {"enabled": True}},
+    )
+
+
 def recommend_events_with_llm(
     users_dict: Dict[int, dict],
-    events_dict: Dict[int, dict]
+    events_dict: Dict[int, dict],
+    events_json: Optional[str] = None,
+    system_instruction: Optional[str] = None,
 ) -> Dict[int, List[int]]:
     """
     Use LLM to match events to users based on their interests based on user dictionary and event dictionary.
@@ -94,142 +393,397 @@ def recommend_events_with_llm(
 
     {user_id: [event_id1, event_id2, event_id3]}
 
+    events_json and system_instruction can be passed in when they were already built for this run.
     """
     if not users_dict or not events_dict:
         print("[recommend_events_with_llm] No users or events to process.")
         return {}
     
     # Build the prompt
-    # We are using textwrap.dedent to format the multi-line string properly with
-    # {{"user_id": 1, "recommended_event_ids": [5, 12, 3]}}, without confusing the syntax. 
-    system_instruction = textwrap.dedent(
-        """
-        You are an event recommendation system. Your task is to match university events
-        to users based on their stated interests and preferred language.
-
-        You will receive:
-        1. A dictionary of USERS with their user_id as key and their interests as value.
-           Interests include "interest_keys" (list of keywords), "interest_text" (free text description of the users interest), and "language_preference" (preferred language).
-        2. A dictionary of EVENTS with event_id as key and event info (title, description, language) as value.
-
-        Your task:
-        - For each user, analyze their interests and find up to {max_events} events
-          that best match their interests and preferred language.
-        - Consider both the interest keywords, the free text description, and the preferred language when matching.
-        - Only recommend events that are genuinely relevant to the user's interests.
-        - If multiple events are equally relevant, prioritize those that match the user's preferred language.
-        - If no events match a user's preferred language, still recommend the most relevant events regardless of language.
-        - If no events match a user's interests very well, recommend fewer or no events for that user.
-
-        OUTPUT FORMAT:
-        Return a JSON ARRAY where each item is an object with:
-        - user_id (integer)
-        - recommended_event_ids (array of integers)
-        - Maximum {max_events} events per user
-        - Order events by relevance (most relevant first)
-
-        Example output:
-        [
-            {{"user_id": 1, "recommended_event_ids": [5, 12, 3]}},
-            {{"user_id": 2, "recommended_event_ids": [7]}},
-            {{"user_id": 3, "recommended_event_ids": [12, 5]}}
-        ]
-
-        If a user has no good matches, you can return an empty array for them, or omit them entirely.
-        """
-    ).format(max_events=MAX_RECOMMENDATIONS_PER_USER)
+    if events_json is None:
+        events_json = dump_prompt_json(events_dict)
+    if system_instruction is None:
+        system_instruction = RECOMMENDATION_SYSTEM_INSTRUCTION
+    messages = build_recommendation_messages(users_dict, events_json, system_instruction)
     
-    user_prompt = f"""
-        USERS (with their interests and preferred language):
-        {json.dumps(users_dict, indent=2)}
-        
-        EVENTS (available for recommendation):
-        {json.dumps(events_dict, indent=2)}
-        
-        Based on the users' interests, recommend the most relevant events for each user.
-        Return ONLY the JSON array with recommendation objects, no additional text.
+    client = get_openrouter_client()
+
+    try:
+        completion = _create_completion(client, messages)
+
+        return parse_recommendations(completion.choices[0].message.content, events_dict)
+
+    except Exception as e:  # pylint: disable=broad-except
+        print(f"[recommend_events_with_llm] Error calling LLM: {e}")
+        return {}
+
+
+def _chunk_users(users_dict: Dict[int, dict], size: int) -> List[Dict[int, dict]]:
     """
-    
-    # Load Gemini API key
-    with open("secrets.json", "r", encoding="utf-8") as f:
-        secrets = json.load(f)
-    
-    # Create Gemini client and make request
-    #client = genai.Client(api_key=secrets["GEMINI_API_KEY"])
-    
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
+    Split the users dictionary into dictionaries of at most `size` users each.
+    """
+    items = list(users_dict.items())
+    return [dict(items[i:i + size]) for i in range(0, len(items), size)]
+
+
+def _tokenize(text: str) -> set:
+    """
+    Lowercase word tokens of a text, without very short words and common stopwords.
+    """
+    return {token for token in _TOKEN_RE.findall(text.lower()) if len(token) > 2 and token not in _STOPWORDS}
+
+
+def tokenize_events(events_dict: Dict[int, dict]) -> Dict[int, set]:
+    """
+    Tokenize title and description of every event once per run, for shortlisting.
+    """
+    return {
+        event_id: _tokenize(f"{event['title']} {event['description']}")
+        for event_id, event in events_dict.items()
+    }
+
+
+def _shortlist_user(user: dict, event_tokens: Dict[int, set]) -> List[int]:
+    """
+    IDs of the RECOMMENDATION_SHORTLIST_SIZE events sharing the most words with the user's
+    interests, best first. Empty if no event shares any word with them.
+    """
+    user_tokens = _tokenize(f"{' '.join(user['interest_keys'])} {user['interest_text']}")
+    scores = {event_id: len(user_tokens & tokens) for event_id, tokens in event_tokens.items()}
+    return [event_id for event_id in sorted(scores, key=scores.get, reverse=True)[:RECOMMENDATION_SHORTLIST_SIZE]
+            if scores[event_id] > 0]
+
+
+def shortlist_events(
+    users_dict: Dict[int, dict],
+    events_dict: Dict[int, dict],
+    event_tokens: Dict[int, set],
+) -> Dict[int, dict]:
+    """
+    Cheap keyword prefilter before the LLM call: for each user, keep the
+    RECOMMENDATION_SHORTLIST_SIZE events sharing the most words with their interests,
+    and return the union over all users (in the original event order).
+
+    Returns events_dict itself if it is already small enough or if some user shares no word
+    with any event, so the LLM still sees every event in those cases.
+    """
+    if len(events_dict) <= RECOMMENDATION_SHORTLIST_SIZE:
+        return events_dict
+
+    shortlisted_ids = set()
+
+    for user in users_dict.values():
+        best = _shortlist_user(user, event_tokens)
+
+        # No keyword overlap at all: let the LLM judge this user against the full list
+        if not best:
+            return events_dict
+
+        shortlisted_ids.update(best)
+
+    return {event_id: event for event_id, event in events_dict.items() if event_id in shortlisted_ids}
+
+
+async def _recommend_chunk(
+    chunk_dict: Dict[int, dict],
+    events_dict: Dict[int, dict],
+    events_json: str,
+    event_tokens: Dict[int, set],
+    client: AsyncOpenAI,
+    sem: asyncio.Semaphore,
+) -> Optional[Dict[int, List[int]]]:
+    """
+    Get recommendations for a chunk of users with a single LLM call. Returns None on failure.
+    Only the keyword shortlist of events for this chunk is sent, and answers are limited to it.
+    When nothing is filtered out, the shared events_json is sent, so the events block stays
+    byte-identical across chunks and can be served from the prompt cache.
+    The semaphore bounds how many requests are in flight at the same time.
+    """
+    candidate_events = shortlist_events(chunk_dict, events_dict, event_tokens)
+    if candidate_events is not events_dict:
+        events_json = dump_prompt_json(candidate_events)
+
+    messages = build_recommendation_messages(chunk_dict, events_json)
+
+    async with sem:
+        try:
+            completion = await _create_completion_async(client, messages)
+
+            recommendations = parse_recommendations(completion.choices[0].message.content, candidate_events)
+
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"[run_event_recommendations] Error processing users {list(chunk_dict)}: {e}")
+            return None
+
+    # Users the model left out get an empty list, replacing any stale recommendations
+    chunk_recommendations = {user_id: recommendations.get(user_id, []) for user_id in chunk_dict}
+
+    for user_id, recommended_ids in chunk_recommendations.items():
+        print(f"[run_event_recommendations] User {user_id} got {len(recommended_ids)} recommendations.")
+
+    return chunk_recommendations
+
+
+async def _recommend_all(db: Session, users_dict: Dict[int, dict], events_dict: Dict[int, dict]) -> int:
+    """
+    Request recommendations for all users over one AsyncOpenAI client, sending
+    RECOMMENDATION_USER_BATCH_SIZE users per call and running the calls concurrently.
+    Each chunk is written to the database as soon as it completes, so slow chunks do not
+    hold back the others. Users whose chunk failed are left unchanged.
+    Returns the number of updated users.
+    """
+    secrets = load_secrets()
+    sem = asyncio.Semaphore(RECOMMENDATION_MAX_CONCURRENCY)
+
+    # Serialize and tokenize the events once; chunks without a shortlist send the same events block
+    events_json = dump_prompt_json(events_dict)
+    event_tokens = tokenize_events(events_dict)
+
+    async with AsyncOpenAI(
+        base_url=OPENROUTER_BASE_URL,
         api_key=secrets["OPENROUTER_API_KEY"],
-    )
+        http_client=create_async_http_client(),
+        max_retries=0,  # _llm_retry is the only retry layer
+    ) as client:
+        tasks = [
+            _recommend_chunk(chunk_dict, events_dict, events_json, event_tokens, client, sem)
+            for chunk_dict in _chunk_users(users_dict, RECOMMENDATION_USER_BATCH_SIZE)
+        ]
 
-    # Define the response schema (Gemini does not support additionalProperties)
-    
+        total_updated = 0
+        for next_done in asyncio.as_completed(tasks):
+            chunk_recommendations = await next_done
+            if chunk_recommendations is not None:
+                total_updated += update_user_recommendations(db, chunk_recommendations)
+
+    return total_updated
+
+
+def _run_coroutine(coro):
+    """
+    Run a coroutine to completion from synchronous code. The pipeline is also started from the
+    FastAPI startup hook, where an event loop is already running, so use a worker thread there.
+    """
     try:
-        # Call OpenRouter / Gemini 2.0 Flash Experimental (free)
-        completion = client.chat.completions.create(
-            model=RECOMMENDATION_LLM_MODEL,
-            messages=[
-                {"role": "system", "content": system_instruction},
-                {"role": "user", "content": user_prompt},
-            ],
-            extra_body={"reasoning": {"enabled": True}},
-        )
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
 
-        raw_content = completion.choices[0].message.content
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
 
-        # Defensive cleanup: strip possible code fences if the model ignores instructions
-        cleaned = raw_content.strip()
-        if cleaned.startswith("```"):
-            # Handle ```json ... ``` or ``` ... ```
-            cleaned = cleaned.strip("`")
-            # In case the first line is 'json'
-            cleaned_lines = cleaned.splitlines()
-            if cleaned_lines and cleaned_lines[0].strip().lower() == "json":
-                cleaned = "\n".join(cleaned_lines[1:]).strip()
 
-        # Parse JSON
-        recommendations_list = json.loads(cleaned)
+def _get_embedding_model():
+    """
+    Load the sentence embedding model once per process.
+    sentence-transformers is only needed for the "embedding" strategy, so it is imported lazily.
+    """
+    global _embedding_model  # pylint: disable=global-statement
 
-        recommendations: Dict[int, List[int]] = {}
+    if _embedding_model is None:
+        from sentence_transformers import SentenceTransformer  # pylint: disable=import-outside-toplevel
+        _embedding_model = SentenceTransformer(RECOMMENDATION_EMBEDDING_MODEL)
 
-        # Loop over recommendations
-        for item in recommendations_list:
-            # Validate item structure
-            if not isinstance(item, dict):
-                continue
+    return _embedding_model
 
-            user_id = item.get("user_id")
-            event_ids = item.get("recommended_event_ids", [])
 
-            if user_id is None:
-                continue
+def _embed_events(db: Session, events_dict: Dict[int, dict]):
+    """
+    Return the normalized embeddings of all events (one row per event, in events_dict order).
+    Embeddings are stored in the event_embeddings table with a hash of the embedded text,
+    so only new or changed events are encoded.
+    """
+    import numpy as np  # pylint: disable=import-outside-toplevel
 
-            # Validate event IDs exist and limit to max recommendations
-            valid_event_ids = [
-                eid for eid in event_ids
-                if eid in events_dict
-            ][:MAX_RECOMMENDATIONS_PER_USER]
+    texts = {event_id: f"{event['title']}. {event['description']}" for event_id, event in events_dict.items()}
+    hashes = {
+        event_id: hashlib.sha1(f"{RECOMMENDATION_EMBEDDING_MODEL}\n{text}".encode("utf-8")).hexdigest()
+        for event_id, text in texts.items()
+    }
 
-            # Only add if there are valid recommendations
-            recommendations[int(user_id)] = valid_event_ids
+    stored = {
+        row.main_event_id: row
+        for row in db.query(EventEmbeddingORM).filter(EventEmbeddingORM.main_event_id.in_(list(events_dict))).all()
+    }
 
-        return recommendations
+    vectors = {
+        event_id: np.frombuffer(row.embedding, dtype=np.float32)
+        for event_id, row in stored.items()
+        if row.content_hash == hashes[event_id]
+    }
 
-    except Exception as e:  # pylint: disable=broad-except
-        print(f"[recommend_events_with_llm] Error calling LLM: {e}")
+    missing = [event_id for event_id in events_dict if event_id not in vectors]
+
+    if missing:
+        print(f"[recommend_events_with_embeddings] Embedding {len(missing)} new or changed events...")
+        encoded = _get_embedding_model().encode([texts[event_id] for event_id in missing], normalize_embeddings=True)
+
+        for event_id, vector in zip(missing, encoded):
+            vector = np.asarray(vector, dtype=np.float32)
+            vectors[event_id] = vector
+
+            if event_id in stored:
+                stored[event_id].content_hash = hashes[event_id]
+                stored[event_id].embedding = vector.tobytes()
+            else:
+                db.add(EventEmbeddingORM(main_event_id=event_id, content_hash=hashes[event_id], embedding=vector.tobytes()))
+
+        db.commit()
+
+    return np.stack([vectors[event_id] for event_id in events_dict])
+
+
+def recommend_events_with_embeddings(
+    db: Session,
+    users_dict: Dict[int, dict],
+    events_dict: Dict[int, dict]
+) -> Dict[int, List[int]]:
+    """
+    Match events to users locally with sentence embeddings instead of an LLM.
+    Users and events are embedded, scored by cosine similarity, and the best
+    MAX_RECOMMENDATIONS_PER_USER events above RECOMMENDATION_EMBEDDING_MIN_SCORE are kept.
+
+    Returns the same {user_id: [event_id1, event_id2, event_id3]} mapping as recommend_events_with_llm.
+    """
+    import numpy as np  # pylint: disable=import-outside-toplevel
+
+    if not users_dict or not events_dict:
+        print("[recommend_events_with_embeddings] No users or events to process.")
         return {}
 
+    event_ids = list(events_dict)
+    event_vecs = _embed_events(db, events_dict)
+
+    user_ids = list(users_dict)
+    user_vecs = _get_embedding_model().encode(
+        [f"{' '.join(user['interest_keys'])}. {user['interest_text']}" for user in users_dict.values()],
+        normalize_embeddings=True,
+    )
+
+    # Vectors are normalized, so the dot product is the cosine similarity
+    scores = user_vecs @ event_vecs.T
+    k = min(MAX_RECOMMENDATIONS_PER_USER, len(event_ids))
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+    recommendations: Dict[int, List[int]] = {}
+
+    for row, user_id in enumerate(user_ids):
+        # argpartition does not sort, so order the top k by score
+        best = sorted(top[row], key=lambda col, row=row: scores[row, col], reverse=True)
+        recommendations[user_id] = [
+            event_ids[col] for col in best
+            if scores[row, col] >= RECOMMENDATION_EMBEDDING_MIN_SCORE
+        ]
+
+    return recommendations
+
+
+def _hash_payload(payload) -> str:
+    """
+    Stable sha256 of a JSON-serializable payload (key order does not matter).
+    """
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _recommendation_cache_key(interests: dict, events_version: str) -> str:
+    """
+    Cache key for a user's recommendations: sha1 of their interests and the events version.
+    """
+    payload = json.dumps({"i": interests, "v": events_version}, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _utcnow() -> datetime:
+    """
+    Current UTC time as a naive datetime, as stored in SQLite.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _get_cached_recommendations(db: Session, user_id: int, cache_key: str) -> Optional[List[int]]:
+    """
+    Look up a user's recommendations for the given cache key, first in memory, then in the
+    user_recommendation_cache table. Returns None on a miss or if the entry is older than the TTL.
+    """
+    key = (user_id, cache_key)
+    oldest_valid = _utcnow() - timedelta(hours=RECOMMENDATION_CACHE_TTL_HOURS)
+
+    with _recommendation_cache_lock:
+        if key in _recommendation_cache:
+            event_ids, created_at = _recommendation_cache[key]
+            if created_at >= oldest_valid:
+                _recommendation_cache.move_to_end(key)
+                return list(event_ids)
+            del _recommendation_cache[key]
+
+    row = (
+        db.query(RecommendationCacheORM.event_ids, RecommendationCacheORM.created_at)
+        .filter(
+            RecommendationCacheORM.user_id == user_id,
+            RecommendationCacheORM.cache_key == cache_key,
+            RecommendationCacheORM.created_at >= oldest_valid,
+        )
+        .first()
+    )
+
+    if row is None:
+        return None
+
+    event_ids, created_at = row
+    _remember_recommendations(key, event_ids, created_at)
+    return list(event_ids)
+
+
+def _remember_recommendations(key: tuple, event_ids: List[int], created_at: datetime) -> None:
+    """
+    Store recommendations in the in-process LRU, evicting the oldest entry when full.
+    """
+    with _recommendation_cache_lock:
+        _recommendation_cache[key] = (list(event_ids), created_at)
+        _recommendation_cache.move_to_end(key)
+        if len(_recommendation_cache) > RECOMMENDATION_CACHE_SIZE:
+            _recommendation_cache.popitem(last=False)
+
+
+def _store_cached_recommendations(db: Session, user_id: int, cache_key: str, event_ids: List[int]) -> None:
+    """
+    Store a user's recommendations in memory and upsert them into the
+    user_recommendation_cache table (committed by the caller).
+    The user's rows for other cache keys are outdated and deleted, so the table keeps one row per user.
+    """
+    created_at = _utcnow()
+    _remember_recommendations((user_id, cache_key), event_ids, created_at)
+
+    db.query(RecommendationCacheORM).filter(
+        RecommendationCacheORM.user_id == user_id,
+        RecommendationCacheORM.cache_key != cache_key,
+    ).delete(synchronize_session=False)
+
+    # INSERT ... ON CONFLICT (user_id, cache_key) DO UPDATE, in a single statement
+    stmt = sqlite_insert(RecommendationCacheORM).values(
+        user_id=user_id, cache_key=cache_key, event_ids=event_ids, created_at=created_at
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "cache_key"],
+        set_={"event_ids": stmt.excluded.event_ids, "created_at": stmt.excluded.created_at},
+    ))
+
 
 def update_user_recommendations(db: Session, recommendations: Dict[int, List[int]]) -> int:
     """
     Update users' suggested_event_ids column with recommendations.
     """
+    if not recommendations:
+        return 0
+
     updated_count = 0
+
+    # Fetch all affected users with one IN (...) query instead of one query per user
+    users = db.query(UserORM).filter(UserORM.user_id.in_(list(recommendations))).all()
+    users_by_id = {user.user_id: user for user in users}
     
     for user_id, event_ids in recommendations.items():
-
-        # Query user
-        user = db.query(UserORM).filter(UserORM.user_id == user_id).first()
+        user = users_by_id.get(user_id)
 
         if user:
             # Replace any existing recommendations with new ones
@@ -248,11 +802,12 @@ def run_event_recommendations(db: Session) -> None:
     Steps:
     1. Get all users with interests
     2. Get all events
-    3. Loop over users one at a time, generating recommendations for each
-    4. Update each user's record after processing
+    3. Split users into chunks of RECOMMENDATION_USER_BATCH_SIZE and generate
+       recommendations with one LLM call per chunk, running the calls concurrently
+    4. Update the users of each chunk with one commit as soon as its call completes
     
-    This approach processes users individually to avoid overwhelming the LLM
-    with too many users at once and to provide more focused recommendations.
+    Chunking keeps the number of calls (and copies of the events list sent) low,
+    while keeping each prompt small enough to give focused recommendations.
     """
     print("[run_event_recommendations] Starting event recommendation pipeline...")
     
@@ -272,35 +827,216 @@ def run_event_recommendations(db: Session) -> None:
         print("[run_event_recommendations] No events found. Skipping recommendations.")
         return
     
-    # Step 3: Process each user individually
-    total_updated = 0
+    # Step 3: Generate recommendations, either locally with embeddings or
+    # concurrently with the LLM (one LLM call per chunk of users)
     total_users = len(users_dict)
+
+    if RECOMMENDATION_STRATEGY == "embedding":
+        print(f"[run_event_recommendations] Matching {total_users} users with embeddings...")
+        recommendations = recommend_events_with_embeddings(db, users_dict, events_dict)
+
+        # Step 4: Update all user records and commit once
+        total_updated = update_user_recommendations(db, recommendations)
+    else:
+        print(f"[run_event_recommendations] Requesting recommendations for {total_users} users "
+              f"in chunks of {RECOMMENDATION_USER_BATCH_SIZE} "
+              f"(up to {RECOMMENDATION_MAX_CONCURRENCY} concurrent requests)...")
+
+        # Step 4 happens per chunk: each chunk's users are updated as soon as its answer arrives
+        total_updated = _run_coroutine(_recommend_all(db, users_dict, events_dict))
     
-    for idx, (user_id, user_interests) in enumerate(users_dict.items(), 1):
-        print(f"[run_event_recommendations] Processing user {user_id} ({idx}/{total_users})...")
-        
-        # Create single-user dictionary for LLM
-        single_user_dict = {user_id: user_interests}
-        
+    print(f"[run_event_recommendations] Pipeline complete. Updated {total_updated}/{total_users} users.")
+
+
+def _to_gemini_request(messages: List[dict]) -> dict:
+    """
+    Convert chat messages from build_recommendation_messages into a Gemini
+    GenerateContentRequest (as used in a batch JSONL line).
+    System messages become the system instruction, user messages the contents.
+    """
+    system_parts: List[dict] = []
+    user_parts: List[dict] = []
+
+    for message in messages:
+        content = message["content"]
+        texts = [content] if isinstance(content, str) else [part["text"] for part in content]
+        target = system_parts if message["role"] == "system" else user_parts
+        target.extend({"text": text} for text in texts)
+
+    return {
+        "system_instruction": {"parts": system_parts},
+        "contents": [{"role": "user", "parts": user_parts}],
+        "generation_config": {"response_mime_type": "application/json"},
+    }
+
+
+def _batch_response_text(response: dict) -> str:
+    """
+    Get the answer text from a GenerateContentResponse in a batch result line (thought parts are skipped).
+    """
+    candidates = response.get("candidates") or []
+    if not candidates:
+        return ""
+
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts if not part.get("thought"))
+
+
+def run_event_recommendations_batch(db: Session) -> None:
+    """
+    Run the event recommendation pipeline through Gemini Batch Mode instead of synchronous calls.
+
+    Batch jobs cost about half as much per token and are not subject to the per-minute
+    rate limits, but may take up to 24 hours to finish. Suitable for the scheduled
+    pipeline, not for on-demand requests.
+
+    This only submits the job and returns; collect_event_recommendations_batch picks up
+    the results in a later scheduled run, so nothing waits for the job here.
+
+    Steps:
+    1. Get all users with interests and all events
+    2. Write one request per chunk of RECOMMENDATION_USER_BATCH_SIZE users to a JSONL file and upload it
+    3. Create the batch job and register it for collection
+    """
+    # google-genai is only needed for this optional path, so it is imported here
+    from google.genai import types  # pylint: disable=import-outside-toplevel
+
+    print("[run_event_recommendations_batch] Starting batch event recommendation pipeline...")
+
+    # Step 1: Get users with interests and events
+    users_dict = get_users_with_interests(db)
+    print(f"[run_event_recommendations_batch] Found {len(users_dict)} users with interests.")
+
+    if not users_dict:
+        print("[run_event_recommendations_batch] No users with interests found. Skipping recommendations.")
+        return
+
+    events_dict = get_events_for_recommendation(db)
+    print(f"[run_event_recommendations_batch] Found {len(events_dict)} events for recommendation.")
+
+    if not events_dict:
+        print("[run_event_recommendations_batch] No events found. Skipping recommendations.")
+        return
+
+    # Step 2: Write the requests file, keyed so results can be mapped back to their chunk
+    events_json = dump_prompt_json(events_dict)
+    chunks = {
+        f"chunk-{idx}": chunk_dict
+        for idx, chunk_dict in enumerate(_chunk_users(users_dict, RECOMMENDATION_USER_BATCH_SIZE))
+    }
+
+    with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False, encoding="utf-8") as f:
+        requests_path = f.name
+        for key, chunk_dict in chunks.items():
+            request = _to_gemini_request(build_recommendation_messages(chunk_dict, events_json))
+            f.write(json.dumps({"key": key, "request": request}) + "\n")
+
+    client = get_gemini_client()
+
+    try:
+        uploaded_file = client.files.upload(
+            file=requests_path,
+            config=types.UploadFileConfig(display_name="event-recommendations", mime_type="jsonl"),
+        )
+    finally:
+        os.remove(requests_path)
+
+    # Step 3: Create the batch job and wait for it to finish
+    batch_job = client.batches.create(
+        model=RECOMMENDATION_BATCH_LLM_MODEL,
+        src=uploaded_file.name,
+        config=types.CreateBatchJobConfig(display_name="event-recommendations"),
+    )
+    print(f"[run_event_recommendations_batch] Created batch job {batch_job.name} with {len(chunks)} requests.")
+
+    # Stored in the database, so the results can still be collected after a restart
+    db.add(RecommendationBatchJobORM(
+        job_name=batch_job.name,
+        chunks={key: list(chunk_dict) for key, chunk_dict in chunks.items()},
+        created_at=_utcnow(),
+    ))
+    db.commit()
+
+
+def collect_event_recommendations_batch(db: Session) -> None:
+    """
+    Check the submitted recommendation batch jobs once (no waiting). For every job that reached
+    a final state, download the results, map them back to the users by request key and update
+    their records. A job is only removed from recommendation_batch_jobs once its results are
+    stored (or it ended without results); jobs that are still running or fail to be collected
+    are checked again on the next call.
+    """
+    pending_jobs = db.query(RecommendationBatchJobORM).all()
+
+    if not pending_jobs:
+        return
+
+    client = get_gemini_client()
+
+    for pending_job in pending_jobs:
+        job_name = pending_job.job_name
+
         try:
-            # Get recommendations from LLM for this single user
-            recommendations = recommend_events_with_llm(single_user_dict, events_dict)
-            
-            # Update user record
-            recommended_ids = recommendations.get(user_id, [])
-            user = db.query(UserORM).filter(UserORM.user_id == user_id).first()
-            
-            if user:
-                user.suggested_event_ids = recommended_ids
-                db.commit()
-                total_updated += 1
-                print(f"[run_event_recommendations] User {user_id} got {len(recommended_ids)} recommendations.")
-            
+            total_updated = _collect_batch_job(db, client, job_name, pending_job.chunks)
         except Exception as e:  # pylint: disable=broad-except
-            print(f"[run_event_recommendations] Error processing user {user_id}: {e}")
+            db.rollback()
+            print(f"[collect_event_recommendations_batch] Error collecting batch job {job_name}, retrying next time: {e}")
             continue
-    
-    print(f"[run_event_recommendations] Pipeline complete. Updated {total_updated}/{total_users} users.")
+
+        if total_updated is None:
+            continue
+
+        db.delete(pending_job)
+        db.commit()
+
+        print(f"[collect_event_recommendations_batch] Batch job {job_name} complete. Updated {total_updated} users.")
+
+
+def _collect_batch_job(db: Session, client, job_name: str, chunks: Dict[str, List[int]]) -> Optional[int]:
+    """
+    Store the results of one batch job. Returns the number of updated users, or None if the
+    job has not reached a final state yet.
+    """
+    batch_job = client.batches.get(name=job_name)
+
+    if batch_job.state.name not in BATCH_FINAL_STATES:
+        print(f"[collect_event_recommendations_batch] Batch job {job_name} is still {batch_job.state.name}.")
+        return None
+
+    if batch_job.state.name not in ("JOB_STATE_SUCCEEDED", "JOB_STATE_PARTIALLY_SUCCEEDED"):
+        print(f"[collect_event_recommendations_batch] Batch job {job_name} ended with {batch_job.state.name}: {batch_job.error}")
+        return 0
+
+    # Validate the answers against the events that are current now, not at submission time
+    events_dict = get_events_for_recommendation(db)
+    result_bytes = client.files.download(file=batch_job.dest.file_name)
+    recommendations: Dict[int, List[int]] = {}
+
+    for line in result_bytes.decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+
+        result = json.loads(line)
+        user_ids = chunks.get(result.get("key"))
+
+        if user_ids is None:
+            continue
+
+        if "response" not in result:
+            print(f"[collect_event_recommendations_batch] Error processing users {user_ids}: {result.get('error')}")
+            continue
+
+        # Malformed answers raise ValueError (invalid JSON) or TypeError (unexpected item shapes)
+        try:
+            chunk_recommendations = parse_recommendations(_batch_response_text(result["response"]), events_dict)
+        except (ValueError, TypeError) as e:
+            print(f"[collect_event_recommendations_batch] Error parsing answer for users {user_ids}: {e}")
+            continue
+
+        for user_id in user_ids:
+            recommendations[user_id] = chunk_recommendations.get(user_id, [])
+
+    return update_user_recommendations(db, recommendations)
 
 
 def run_single_user_recommendations(db: Session, user_id: int) -> dict:
@@ -372,12 +1108,29 @@ def run_single_user_recommendations(db: Session, user_id: int) -> dict:
             "recommended_event_ids": []
         }
     
-    # Step 3: Get recommendations from LLM
-    print(f"[run_single_user_recommendations] Calling LLM for user {user_id}...")
-    recommendations = recommend_events_with_llm(users_dict, events_dict)
+    # Step 3: Get recommendations from the cache, or from LLM (or embeddings) on a miss
+    # There is no event update timestamp, so the events version is a hash of the events sent
+    events_version = _hash_payload({"strategy": RECOMMENDATION_STRATEGY, "events": events_dict})
+    cache_key = _recommendation_cache_key(users_dict[user_id], events_version)
+    recommended_ids = _get_cached_recommendations(db, user_id, cache_key)
+
+    if recommended_ids is not None:
+        print(f"[run_single_user_recommendations] Using cached recommendations for user {user_id}.")
+    else:
+        if RECOMMENDATION_STRATEGY == "embedding":
+            recommendations = recommend_events_with_embeddings(db, users_dict, events_dict)
+        else:
+            print(f"[run_single_user_recommendations] Calling LLM for user {user_id}...")
+            candidate_events = shortlist_events(users_dict, events_dict, tokenize_events(events_dict))
+            recommendations = recommend_events_with_llm(users_dict, candidate_events)
+
+        recommended_ids = recommendations.get(user_id, [])
+
+        # Failed LLM calls return no entry for the user; only cache real answers
+        if user_id in recommendations:
+            _store_cached_recommendations(db, user_id, cache_key, recommended_ids)
 
     # Step 4: Update user record
-    recommended_ids = recommendations.get(user_id, [])
     user.suggested_event_ids = recommended_ids
     db.commit()
     
@@ -0,0 +1,78 @@
+import json
+import threading
+from typing import TYPE_CHECKING
+
+import httpx
+from openai import DEFAULT_TIMEOUT, OpenAI
+
+if TYPE_CHECKING:
+    from google import genai
+
+#
+#   This file provides shared LLM clients for the services.
+#   Each client is created on first use and then reused, so secrets.json is read
+#   and the HTTP connection pool is set up once per process instead of once per call.
+#
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+# Connection pool for the Gemini and OpenRouter clients. HTTP/2 multiplexes concurrent requests over one connection.
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+
+_gemini_client = None
+_openrouter_client = None
+_clients_lock = threading.Lock()
+
+
+def load_secrets() -> dict:
+    """
+    Load the API keys and credentials from secrets.json.
+    """
+    with open("secrets.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_gemini_client() -> "genai.Client":
+    """
+    Return the shared Gemini client, creating it on first use.
+    google-genai is imported here, so modules that only use OpenRouter do not load it.
+    """
+    global _gemini_client  # pylint: disable=global-statement
+
+    with _clients_lock:
+        if _gemini_client is None:
+            from google import genai  # pylint: disable=import-outside-toplevel
+            from google.genai import types  # pylint: disable=import-outside-toplevel
+            _gemini_client = genai.Client(
+                api_key=load_secrets()["GEMINI_API_KEY"],
+                # Same pooled HTTP/2 settings as the OpenRouter client
+                http_options=types.HttpOptions(client_args={"http2": True, "limits": HTTP_LIMITS}),
+            )
+
+    return _gemini_client
+
+
+def get_openrouter_client() -> OpenAI:
+    """
+    Return the shared synchronous OpenRouter (OpenAI-compatible) client, creating it on first use.
+    """
+    global _openrouter_client  # pylint: disable=global-statement
+
+    with _clients_lock:
+        if _openrouter_client is None:
+            _openrouter_client = OpenAI(
+                base_url=OPENROUTER_BASE_URL,
+                api_key=load_secrets()["OPENROUTER_API_KEY"],
+                http_client=httpx.Client(http2=True, timeout=DEFAULT_TIMEOUT, limits=HTTP_LIMITS),
+                max_retries=0,  # retries are handled by tenacity in event_recommender
+            )
+
+    return _openrouter_client
+
+
+def create_async_http_client() -> httpx.AsyncClient:
+    """
+    Create an HTTP/2 client for an AsyncOpenAI client. Async clients are bound to the event loop
+    they are used in, so one is created per run instead of sharing a module-level instance.
+    """
+    return httpx.AsyncClient(http2=True, timeout=DEFAULT_TIMEOUT, limits=HTTP_LIMITS)
@@ -6,17 +6,46 @@ import hashlib
 import imaplib
 import email
 from datetime import datetime
+from email.parser import BytesParser
 from email.policy import default
 from typing import Dict, Any, Optional, List
 
 import warnings
+try:
+    import orjson  # optional: faster reading and writing of the index and per-email JSON files
+except ImportError:
+    orjson = None
 from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
 
+try:
+    from selectolax.lexbor import LexborHTMLParser  # optional: native HTML-to-text, BeautifulSoup is the fallback
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import pyarrow as pa  # optional: single-file email corpus for the extraction script
+    from pyarrow import feather
+except ImportError:
+    pa = None
+    feather = None
+
 from backend.config import IMAP_HOST, IMAP_PORT  # pylint: disable=import-error
 
 
 warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
 
+COMBINED_WRITE_BUFFER = 1 << 20  # output buffer for combined batch TXT files
+
+FILTER_RE = re.compile(r"rundmail|wiwinews", re.IGNORECASE)
+RAW_FILTER_RE = re.compile(rb"rundmail|wiwinews", re.IGNORECASE)
+# Bodies in these encodings can contain the keywords without them appearing in the raw bytes
+ENCODED_BODY_RE = re.compile(
+    rb"content-transfer-encoding:\s*(?:base64|quoted-printable)|charset=\"?utf-?(?:16|32)", re.IGNORECASE
+)
+
+CORPUS_FILENAME = "emails.feather"  # all kept emails as one Arrow table
+CORPUS_COLUMNS = ("email_id", "subject", "from", "date", "body_text")
+
 
 # ----------------------------
 # Helpers
@@ -26,8 +55,31 @@ def _safe_filename(s: str) -> str:
 
 
 def _hash_fallback(sender: str, subject: str, date_str: str, body_snippet: str) -> str:
-    raw = f"{sender}|{subject}|{date_str}|{body_snippet}".encode("utf-8", errors="ignore")
-    return hashlib.sha256(raw).hexdigest()[:32]
+    # Hash the parts incrementally; same digest as sha256("sender|subject|date|snippet")
+    h = hashlib.sha256()
+    for i, part in enumerate((sender, subject, date_str, body_snippet)):
+        if i:
+            h.update(b"|")
+        h.update(part.encode("utf-8", errors="ignore"))
+    return h.hexdigest()[:32]
+
+
+def _hash_snippet(body: str) -> str:
+    # Whitespace-free start of the body, so the fallback id does not depend on how the HTML
+    # converter (selectolax or BeautifulSoup) lays out newlines and spaces
+    return "".join(body.split())[:200]
+
+
+def _html_to_text(html: str) -> str:
+    if LexborHTMLParser is not None:
+        try:
+            tree = LexborHTMLParser(html)
+            tree.strip_tags(["script", "style"])
+            # Whitespace can still differ from get_text("\n"); _hash_snippet ignores it for the fallback id
+            return tree.text(separator="\n", strip=False)
+        except Exception:  # pylint: disable=broad-exception-caught
+            pass
+    return BeautifulSoup(html, "lxml").get_text("\n")
 
 
 def _extract_text_from_email(em: email.message.EmailMessage) -> str:
@@ -46,15 +98,23 @@ def _extract_text_from_email(em: email.message.EmailMessage) -> str:
         for part in em.walk():
             if part.get_content_type() == "text/html":
                 html = part.get_content()
-                text = BeautifulSoup(html, "lxml").get_text("\n")
+                text = _html_to_text(html)
                 break
 
     return text or "[no text body]"
 
 
 def _passes_filter(body: str) -> bool:
-    b = body.lower()
-    return ("rundmail" in b) or ("wiwinews" in b)
+    # One case-insensitive scan instead of lowercasing the whole body
+    return FILTER_RE.search(body) is not None
+
+
+def _may_pass_filter(raw: bytes) -> bool:
+    """
+    Cheap check on the raw RFC822 bytes before MIME parsing and text extraction.
+    False only if the email cannot pass _passes_filter; encoded bodies always go to the full check.
+    """
+    return RAW_FILTER_RE.search(raw) is not None or ENCODED_BODY_RE.search(raw) is not None
 
 
 def _load_index(index_path: str) -> Dict[str, Any]:
@@ -71,14 +131,102 @@ def _load_index(index_path: str) -> Dict[str, Any]:
             "email_ids": [],  # convenience cache for idempotency
             "batches": {},    # batch_name -> list[email_id]
         }
-    with open(index_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    with open(index_path, "rb") as f:
+        return _json_loads(f.read())
+
+
+def _json_loads(data: bytes) -> Any:
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def _json_dumps(obj: Any) -> bytes:
+    # Same layout as json.dump(..., ensure_ascii=False, indent=2), encoded as UTF-8
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
 
 
 def _save_index(index_path: str, index: Dict[str, Any]) -> None:
     index["updated_at"] = datetime.utcnow().isoformat()
-    with open(index_path, "w", encoding="utf-8") as f:
-        json.dump(index, f, ensure_ascii=False, indent=2)
+    with open(index_path, "wb") as f:
+        f.write(_json_dumps(index))
+
+
+def _raw_messages_by_id(msg_data: List[Any]) -> Dict[bytes, bytes]:
+    """
+    Map message numbers to raw bytes from a multi-message FETCH response.
+    imaplib returns (b"<num> (RFC822 {size}", raw) tuples interleaved with b")" separators.
+    """
+    raw_by_id: Dict[bytes, bytes] = {}
+    for item in msg_data:
+        if isinstance(item, tuple) and len(item) >= 2:
+            raw_by_id[item[0].split(None, 1)[0]] = item[1]
+    return raw_by_id
+
+
+def _email_id_from_header(parser: BytesParser, header: Optional[bytes]) -> Optional[str]:
+    """
+    Stable email_id from a fetched Message-ID header block, or None if there is no Message-ID
+    (those emails get a body-based hash id, so they need the full fetch).
+    """
+    if not header:
+        return None
+    message_id = (parser.parsebytes(header, headersonly=True).get("message-id") or "").strip()
+    if not message_id:
+        return None
+    return _safe_filename(message_id.strip("<>"))
+
+
+def _write_corpus(
+    corpus_path: str,
+    emails_json_dir: str,
+    email_ids: List[str],
+    new_records: Dict[str, Dict[str, Any]],
+) -> Optional[Dict[str, int]]:
+    """
+    Append the emails that are not in the Feather corpus (zstd) yet and return email_id -> row index.
+    Rows already in the corpus are kept as they are, so their row indices stay stable; only the
+    new batch's records are added. Emails stored before the corpus existed are read from their
+    per-email JSON once, on the first run that creates it.
+    Returns None if pyarrow is not installed.
+    """
+    if pa is None:
+        print("[batch_email_downloader] pyarrow not installed, skipping email corpus.")
+        return None
+
+    table = feather.read_table(corpus_path) if os.path.exists(corpus_path) else None
+    rows: Dict[str, int] = {}
+    if table is not None:
+        rows = {eid: i for i, eid in enumerate(table.column("email_id").to_pylist())}
+
+    columns: Dict[str, List[str]] = {col: [] for col in CORPUS_COLUMNS}
+    for eid in email_ids:
+        if eid in rows:
+            continue
+        record = new_records.get(eid)
+        if record is None:
+            json_path = os.path.join(emails_json_dir, f"{eid}.json")
+            if not os.path.exists(json_path):
+                continue
+            with open(json_path, "rb") as f:
+                record = _json_loads(f.read())
+
+        rows[eid] = len(rows)
+        for col in CORPUS_COLUMNS:
+            columns[col].append(record.get(col) or "")
+
+    if not columns["email_id"]:
+        return rows
+
+    new_table = pa.table(columns)
+    if table is not None:
+        new_table = pa.concat_tables([table.select(list(CORPUS_COLUMNS)), new_table])
+
+    # Write next to the corpus and swap it in, so an interrupted run keeps the previous file
+    tmp_path = corpus_path + ".tmp"
+    feather.write_feather(new_table, tmp_path, compression="zstd")
+    os.replace(tmp_path, corpus_path)
+    return rows
 
 
 def _render_email_txt(subject: str, sender: str, date_str: str, body: str) -> str:
@@ -111,9 +259,10 @@ def download_emails_batched(
     Download emails newest-first until `target_count` emails that pass the filter are stored.
 
     This function is:
-    - Batched: fetches `fetch_chunk_size` emails per IMAP iteration
+    - Batched: fetches `fetch_chunk_size` emails per IMAP FETCH command
     - Idempotent: never duplicates already-stored emails (stable email_id)
-    - Evaluation-ready: stores per-email JSON, per-email TXT, per-batch combined TXT, and index.json
+    - Evaluation-ready: stores per-email JSON, per-email TXT, per-batch combined TXT, index.json
+      and (if pyarrow is installed) all emails as one Feather table
 
     Batch partitioning:
     - After download, emails are assigned to batches: batch_01 ... batch_0N
@@ -173,18 +322,34 @@ def download_emails_batched(
         uids_newest_first = uids_newest_first[:max_fetch_uids]
 
     kept_count_before = len(existing_ids)
+    new_records: Dict[str, Dict[str, Any]] = {}
     cursor = 0
+    parser = BytesParser(policy=default)
 
     try:
         while len(existing_ids) < target_count and cursor < len(uids_newest_first):
             chunk_uids = uids_newest_first[cursor : cursor + fetch_chunk_size]
             cursor += fetch_chunk_size
 
-            for uid in chunk_uids:
-                # Fetch raw email
-                typ, msg_data = M.fetch(uid, "(RFC822)")  # pylint: disable=unused-variable
-                raw = msg_data[0][1]
-                em = email.message_from_bytes(raw, policy=default)
+            # Header-only FETCH first: emails whose Message-ID is already stored are not downloaded again
+            typ, header_data = M.fetch(b",".join(chunk_uids), "(BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])")  # pylint: disable=unused-variable
+            header_by_uid = _raw_messages_by_id(header_data)
+            new_uids = [
+                uid for uid in chunk_uids
+                if _email_id_from_header(parser, header_by_uid.get(uid)) not in existing_ids
+            ]
+            if not new_uids:
+                continue
+
+            # One FETCH per chunk (sequence set "n1,n2,...") instead of one round trip per message
+            typ, msg_data = M.fetch(b",".join(new_uids), "(RFC822)")  # pylint: disable=unused-variable
+            raw_by_uid = _raw_messages_by_id(msg_data)
+
+            for uid in new_uids:
+                raw = raw_by_uid.get(uid)
+                if raw is None or not _may_pass_filter(raw):
+                    continue
+                em = parser.parsebytes(raw)
 
                 subject = em.get("subject") or ""
                 sender = em.get("from") or ""
@@ -201,8 +366,10 @@ def download_emails_batched(
                 if message_id:
                     email_id = _safe_filename(message_id.strip("<>"))
                 else:
-                    snippet = body[:200]
-                    email_id = _hash_fallback(sender, subject, date_str, snippet)
+                    email_id = _hash_fallback(sender, subject, date_str, _hash_snippet(body))
+                    # Datasets from before _hash_snippet stored these emails under a body[:200] id
+                    if _hash_fallback(sender, subject, date_str, body[:200]) in existing_ids:
+                        continue
 
                 # Idempotency: skip if already stored
                 if email_id in existing_ids:
@@ -225,8 +392,8 @@ def download_emails_batched(
                 # Write per-email JSON (never overwrite)
                 json_path = os.path.join(emails_json_dir, f"{email_id}.json")
                 if not os.path.exists(json_path):
-                    with open(json_path, "w", encoding="utf-8") as f:
-                        json.dump(email_record, f, ensure_ascii=False, indent=2)
+                    with open(json_path, "wb") as f:
+                        f.write(_json_dumps(email_record))
 
                 # Write per-email TXT (never overwrite)
                 txt_path = os.path.join(emails_txt_dir, f"{email_id}.txt")
@@ -245,6 +412,7 @@ def download_emails_batched(
                     }
                 )
                 existing_ids.add(email_id)
+                new_records[email_id] = email_record
 
                 if len(existing_ids) >= target_count:
                     break
@@ -268,19 +436,31 @@ def download_emails_batched(
 
     index["batches"] = batches
 
+    # Single-file corpus; index entries point at their row
+    corpus_rows = _write_corpus(
+        os.path.join(out_dir, CORPUS_FILENAME), emails_json_dir, sorted_ids, new_records
+    )
+    if corpus_rows is not None:
+        index["corpus"] = CORPUS_FILENAME
+        for entry in index["emails"]:
+            entry["corpus_row"] = corpus_rows.get(entry["email_id"])
+
     # Write combined batch TXT files (overwrites allowed, because it is derived output)
     for batch_name, email_ids in batches.items():
         combined_path = os.path.join(batches_dir, f"{batch_name}.txt")
-        with open(combined_path, "w", encoding="utf-8") as out_f:
-            out_f.write(f"=== {batch_name} ({len(email_ids)} emails) ===\n\n")
+        # Per-email TXT files are already UTF-8, so copy their bytes instead of decoding/re-encoding.
+        # Bodies can carry \r\n; they are normalized to \n like a text-mode read would do.
+        with open(combined_path, "wb", buffering=COMBINED_WRITE_BUFFER) as out_f:
+            out_f.write(f"=== {batch_name} ({len(email_ids)} emails) ===\n\n".encode("utf-8"))
             for i, eid in enumerate(email_ids, start=1):
                 per_email_txt = os.path.join(emails_txt_dir, f"{eid}.txt")
-                out_f.write(f"\n\n---------------- EMAIL {i:03d} / {eid} START ----------------\n")
+                out_f.write(f"\n\n---------------- EMAIL {i:03d} / {eid} START ----------------\n".encode("utf-8"))
                 if os.path.exists(per_email_txt):
-                    out_f.write(open(per_email_txt, "r", encoding="utf-8").read())
+                    with open(per_email_txt, "rb") as src:
+                        out_f.write(src.read().replace(b"\r\n", b"\n").replace(b"\r", b"\n"))
                 else:
-                    out_f.write("[missing per-email txt]\n")
-                out_f.write(f"---------------- EMAIL {i:03d} / {eid} END ----------------\n")
+                    out_f.write(b"[missing per-email txt]\n")
+                out_f.write(f"---------------- EMAIL {i:03d} / {eid} END ----------------\n".encode("utf-8"))
 
     _save_index(index_path, index)
 
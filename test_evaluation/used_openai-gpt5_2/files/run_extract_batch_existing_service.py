@@ -1,13 +1,28 @@
 from __future__ import annotations
 
 import argparse
+import asyncio
 import json
 from pathlib import Path
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
-from openpyxl import Workbook
-from openpyxl.utils import get_column_letter
+import xlsxwriter
+
+try:
+    import orjson  # optional: faster reading and writing of the dataset and result JSON files
+except ImportError:
+    orjson = None
+
+try:
+    import pyexcelerate  # optional: faster XLSX writer for --fast-xlsx
+except ImportError:
+    pyexcelerate = None
+
+try:
+    from pyarrow import feather  # optional: read the single-file email corpus
+except ImportError:
+    feather = None
 
 # IMPORTANT: uses your existing services extractor (do not modify services)
 from backend.services.event_recognizer import extract_event_info_with_llm  # pylint: disable=import-error
@@ -15,6 +30,11 @@ from backend.services.event_recognizer import extract_event_info_with_llm  # pyl
 
 DATASET_DIR = Path("backend/tests/evaluation/data/raw_emails_150")
 PRED_ROOT = Path("backend/tests/evaluation/predictions")
+CORPUS_PATH = DATASET_DIR / "emails.feather"
+MAX_CONCURRENT_BATCHES = 3  # default cap on parallel LLM calls for --all-batches
+
+# email_id -> row dict, loaded once from the Feather corpus
+_corpus: Optional[Dict[str, Dict[str, Any]]] = None
 
 # The “must-check” fields you agreed on (export subset)
 FILTER_FIELDS = [
@@ -27,17 +47,42 @@ FILTER_FIELDS = [
     "Event_Type", "Main_Event_Temp_Key",
 ]
 
+def load_json(path: Path) -> Any:
+    if orjson:
+        return orjson.loads(path.read_bytes())
+    return json.loads(path.read_text("utf-8"))
+
 def load_index() -> Dict[str, Any]:
     idx_path = DATASET_DIR / "index.json"
     if not idx_path.exists():
         raise FileNotFoundError(f"Missing dataset index: {idx_path}")
-    return json.loads(idx_path.read_text(encoding="utf-8"))
+    return load_json(idx_path)
+
+def load_corpus() -> Dict[str, Dict[str, Any]]:
+    """
+    Load the Feather corpus written by the downloader into a dict keyed by email_id.
+    Returns an empty dict if the file or pyarrow is missing.
+    """
+    global _corpus  # pylint: disable=global-statement
+    if _corpus is None:
+        _corpus = {}
+        if feather is not None and CORPUS_PATH.exists():
+            columns = feather.read_table(CORPUS_PATH).to_pydict()
+            keys = list(columns)
+            for values in zip(*(columns[k] for k in keys)):
+                row = dict(zip(keys, values))
+                _corpus[row["email_id"]] = row
+    return _corpus
 
 def load_email_json(email_id: str) -> Dict[str, Any]:
+    row = load_corpus().get(email_id)
+    if row is not None:
+        return row
+
     p = DATASET_DIR / "emails_json" / f"{email_id}.json"
     if not p.exists():
         raise FileNotFoundError(f"Missing per-email JSON: {p}")
-    return json.loads(p.read_text(encoding="utf-8"))
+    return load_json(p)
 
 def build_batch_input_text(batch_name: str, email_ids: List[str]) -> str:
     """
@@ -80,40 +125,50 @@ def filter_events(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
 
 def save_json(path: Path, obj: Any) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+    if orjson:
+        path.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    else:
+        path.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
 
-def save_excel(path: Path, filtered_events: List[Dict[str, Any]]) -> None:
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Events"
+def save_excel_fast(path: Path, filtered_events: List[Dict[str, Any]]) -> None:
+    """
+    Write the whole sheet in one pass with pyexcelerate (no per-cell objects).
+    Same layout as save_excel.
+    """
+    rows = [FILTER_FIELDS] + [[ev.get(k, None) for k in FILTER_FIELDS] for ev in filtered_events]
 
-    ws.append(FILTER_FIELDS)
+    wb = pyexcelerate.Workbook()
+    ws = wb.new_sheet("Events", data=rows)
+    for col_idx in range(1, len(FILTER_FIELDS) + 1):
+        ws.set_col_style(col_idx, pyexcelerate.Style(size=22))
 
-    for ev in filtered_events:
-        ws.append([ev.get(k, None) for k in FILTER_FIELDS])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    wb.save(str(path))
 
-    # Column widths
-    for col_idx in range(1, len(FILTER_FIELDS) + 1):
-        ws.column_dimensions[get_column_letter(col_idx)].width = 22
+def save_excel(path: Path, filtered_events: List[Dict[str, Any]], fast: bool = False) -> None:
+    if fast:
+        if pyexcelerate is not None:
+            save_excel_fast(path, filtered_events)
+            return
+        print("[extract_batch] pyexcelerate not installed, using xlsxwriter.")
 
     path.parent.mkdir(parents=True, exist_ok=True)
-    wb.save(path)
 
-def main() -> None:
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--batch", type=str, default="batch_01", help="e.g., batch_01 ... batch_05")
-    args = parser.parse_args()
+    # constant_memory flushes each row to disk once the next row starts
+    wb = xlsxwriter.Workbook(str(path), {"constant_memory": True, "use_zip64": True})
+    ws = wb.add_worksheet("Events")
+    ws.set_column(0, len(FILTER_FIELDS) - 1, 22)
 
-    idx = load_index()
-    batches = idx.get("batches", {})
-    if args.batch not in batches:
-        raise KeyError(f"Batch not found in index.json: {args.batch}")
+    ws.write_row(0, 0, FILTER_FIELDS)
+    for row_idx, ev in enumerate(filtered_events, start=1):
+        ws.write_row(row_idx, 0, [ev.get(k, None) for k in FILTER_FIELDS])
 
-    email_ids: List[str] = batches[args.batch]
-    batch_text = build_batch_input_text(args.batch, email_ids)
+    wb.close()
 
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    out_dir = PRED_ROOT / f"{args.batch}_{ts}"
+def extract_batch(batch_name: str, email_ids: List[str], ts: str, fast_xlsx: bool = False) -> None:
+    batch_text = build_batch_input_text(batch_name, email_ids)
+
+    out_dir = PRED_ROOT / f"{batch_name}_{ts}"
     out_dir.mkdir(parents=True, exist_ok=True)
 
     # Save exact input for reproducibility
@@ -122,7 +177,7 @@ def main() -> None:
     # ONE LLM CALL (existing services function)
     events = extract_event_info_with_llm(batch_text)
     if not isinstance(events, list):
-        raise ValueError("LLM output is not a list; cannot proceed safely.")
+        raise ValueError(f"LLM output for {batch_name} is not a list; cannot proceed safely.")
 
     # Save full output (audit/debug)
     save_json(out_dir / "events_full.json", events)
@@ -130,11 +185,51 @@ def main() -> None:
     # Save filtered output (what you will share and inspect)
     filtered = filter_events(events)
     save_json(out_dir / "events_filtered.json", filtered)
-    save_excel(out_dir / "events_filtered.xlsx", filtered)
+    save_excel(out_dir / "events_filtered.xlsx", filtered, fast=fast_xlsx)
 
-    print(f"[extract_batch] Batch: {args.batch}")
+    print(f"[extract_batch] Batch: {batch_name}")
     print(f"[extract_batch] Events extracted: {len(events)}")
     print(f"[extract_batch] Saved folder: {out_dir}")
 
+async def extract_all_batches(
+    batches: Dict[str, List[str]], ts: str, fast_xlsx: bool, max_concurrency: int
+) -> None:
+    """
+    Run extract_batch for every batch at once (one worker thread each).
+    The semaphore caps how many LLM calls are in flight.
+    """
+    load_corpus()  # load once before the worker threads need it
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_one(batch_name: str, email_ids: List[str]) -> None:
+        async with semaphore:
+            await asyncio.to_thread(extract_batch, batch_name, email_ids, ts, fast_xlsx)
+
+    async with asyncio.TaskGroup() as tg:
+        for batch_name, email_ids in batches.items():
+            tg.create_task(run_one(batch_name, email_ids))
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=str, default="batch_01", help="e.g., batch_01 ... batch_05")
+    parser.add_argument("--all-batches", action="store_true", help="extract every batch in index.json concurrently")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENT_BATCHES, help="LLM calls in flight with --all-batches")
+    parser.add_argument("--fast-xlsx", action="store_true", help="write the Excel file with pyexcelerate")
+    args = parser.parse_args()
+
+    idx = load_index()
+    batches = idx.get("batches", {})
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    if args.all_batches:
+        asyncio.run(extract_all_batches(batches, ts, args.fast_xlsx, args.max_concurrency))
+        return
+
+    if args.batch not in batches:
+        raise KeyError(f"Batch not found in index.json: {args.batch}")
+
+    extract_batch(args.batch, batches[args.batch], ts, args.fast_xlsx)
+
 if __name__ == "__main__":
     main()
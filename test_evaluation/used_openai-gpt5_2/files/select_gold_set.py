@@ -2,18 +2,32 @@ from __future__ import annotations
 
 import argparse
 import json
+import os
 import re
-from dataclasses import dataclass
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 
+try:
+    import orjson  # optional: faster reading and writing of the prediction and pack JSON files
+except ImportError:
+    orjson = None
 from openpyxl import Workbook
 from openpyxl.utils import get_column_letter
 
+try:
+    import ahocorasick  # optional: match all event URLs against each block in one pass
+except ImportError:
+    ahocorasick = None
+
 
 PRED_ROOT = Path("backend/tests/evaluation/predictions")
 OUT_ROOT = Path("backend/tests/evaluation/gold_selection")
+PACK_WRITE_WORKERS = 8  # threads writing the pack_for_chatgpt files
+
 
 # --- Heuristic cues (for picking borderline/negative examples without LLM calls) ---
 EVENT_CUE_PATTERNS = [
@@ -26,34 +40,152 @@ EVENT_CUE_PATTERNS = [
     r"\b\d{4}-\d{2}-\d{2}\b",
     r"\b\d{1,2}/\d{1,2}/\d{4}\b",
     r"\b\d{1,2}:\d{2}\b",
-    r"\b(c\.t\.|s\.t\.)\b",
+    r"\b(?:c\.t\.|s\.t\.)\b",
 ]
-EVENT_CUE_RE = re.compile("|".join(EVENT_CUE_PATTERNS), re.IGNORECASE)
+# One alternation of non-capturing groups, so each block is scanned once
+EVENT_CUE_RE = re.compile("|".join(f"(?:{p})" for p in EVENT_CUE_PATTERNS), re.IGNORECASE)
 
 
-EMAIL_BLOCK_RE = re.compile(
-    r"--------------- EMAIL:\s*(\d+)\s*Start ---------------(.*?)--------------- EMAIL:\s*\1\s*End ---------------",
-    re.DOTALL,
-)
+# Email blocks are "--------------- EMAIL: N Start ---------------" ... "--------------- EMAIL: N End ---------------"
+EMAIL_MARKER = "--------------- EMAIL:"
+# Rest of a marker after EMAIL_MARKER (anchored with .match, so it never scans)
+MARKER_TAIL_RE = re.compile(r"\s*(\d+)\s*(Start|End) ---------------")
 
 URL_RE = re.compile(r"https?://\S+", re.IGNORECASE)
 
+# Event fields whose URLs are matched against the email blocks
+URL_FIELDS = ("URL", "Registration_URL", "Meeting_URL")
+
+# Title tokens used for linking (ASCII alphanumerics, lowercased after matching)
+TOKEN_RE = re.compile(r"[A-Za-z0-9]+")
+MIN_TITLE_TOKEN_LEN = 4
+
 
 @dataclass
 class EmailBlock:
     idx: int
     raw_block: str
+    raw_block_lower: str  # lowercased once here, reused for every event
+    has_event_cues: bool  # EVENT_CUE_RE hit, computed once at parse time
 
 
 def parse_email_blocks(batch_input_text: str) -> List[EmailBlock]:
+    """
+    Split the batch input into email blocks with a forward str.find scan.
+    Each block runs from a Start marker to the first End marker with the same number
+    (markers without a matching End marker are skipped).
+    """
+    text = batch_input_text
     blocks: List[EmailBlock] = []
-    for m in EMAIL_BLOCK_RE.finditer(batch_input_text):
-        idx = int(m.group(1))
-        raw = m.group(0)
-        blocks.append(EmailBlock(idx=idx, raw_block=raw))
+    pos = text.find(EMAIL_MARKER)
+    while pos != -1:
+        start = MARKER_TAIL_RE.match(text, pos + len(EMAIL_MARKER))
+        block_end = -1
+        if start is not None and start.group(2) == "Start":
+            number = start.group(1)
+            end_pos = text.find(EMAIL_MARKER, start.end())
+            while end_pos != -1:
+                end = MARKER_TAIL_RE.match(text, end_pos + len(EMAIL_MARKER))
+                if end is not None and end.group(2) == "End" and end.group(1) == number:
+                    block_end = end.end()
+                    break
+                end_pos = text.find(EMAIL_MARKER, end_pos + 1)
+
+        if block_end == -1:
+            pos = text.find(EMAIL_MARKER, pos + 1)
+            continue
+
+        idx = int(number)
+        raw = text[pos:block_end]
+        pos = text.find(EMAIL_MARKER, block_end)
+        blocks.append(EmailBlock(
+            idx=idx,
+            raw_block=raw,
+            raw_block_lower=raw.lower(),
+            has_event_cues=EVENT_CUE_RE.search(raw) is not None,
+        ))
     return blocks
 
 
+@dataclass
+class BlockTextIndex:
+    """
+    All lowercased blocks of a batch joined into one UTF-8 buffer, so a URL or title token is located
+    with one bytes.find scan instead of one substring test per block. Results are memoized per needle.
+    Lowercasing happens on str before encoding, so matches are the same as on the str blocks
+    (UTF-8 needles can only match at character boundaries).
+    """
+    text: bytes
+    starts: List[int]  # offset of each block in `text`
+    ends: List[int]
+    hits: Dict[str, Tuple[int, ...]] = field(default_factory=dict)
+
+
+def build_block_index(blocks: List[EmailBlock]) -> BlockTextIndex:
+    encoded = [b.raw_block_lower.encode("utf-8", errors="surrogatepass") for b in blocks]
+    starts: List[int] = []
+    ends: List[int] = []
+    pos = 0
+    for raw in encoded:
+        starts.append(pos)
+        pos += len(raw)
+        ends.append(pos)
+        pos += 1  # b"\0" separator
+    return BlockTextIndex(text=b"\0".join(encoded), starts=starts, ends=ends)
+
+
+def blocks_containing(index: BlockTextIndex, needle_lower: str) -> Tuple[int, ...]:
+    """
+    Positions (in the blocks list) of all blocks that contain `needle_lower`
+    (same result as `needle_lower in block` per block).
+    """
+    if not needle_lower:
+        return ()
+    cached = index.hits.get(needle_lower)
+    if cached is not None:
+        return cached
+
+    needle = needle_lower.encode("utf-8", errors="surrogatepass")
+    found: List[int] = []
+    pos = index.text.find(needle)
+    while pos != -1:
+        i = bisect_right(index.starts, pos) - 1
+        if pos + len(needle) <= index.ends[i]:
+            # hit inside block i; continue after it
+            found.append(i)
+            pos = index.text.find(needle, index.ends[i])
+        else:
+            # match spans a separator; not a hit for any single block
+            pos = index.text.find(needle, pos + 1)
+
+    index.hits[needle_lower] = tuple(found)
+    return index.hits[needle_lower]
+
+
+def prime_block_index(index: BlockTextIndex, blocks: List[EmailBlock], needles_lower: Set[str]) -> None:
+    """
+    Fill the block index cache for many needles at once with an Aho-Corasick automaton,
+    scanning each block once instead of once per needle. No-op without pyahocorasick.
+    """
+    if ahocorasick is None:
+        return
+    needles = {n for n in needles_lower if n and n not in index.hits}
+    if not needles:
+        return
+
+    automaton = ahocorasick.Automaton()
+    for n in needles:
+        automaton.add_word(n, n)
+    automaton.make_automaton()
+
+    found: Dict[str, List[int]] = {n: [] for n in needles}
+    for pos, b in enumerate(blocks):
+        for n in {n for _, n in automaton.iter(b.raw_block_lower)}:
+            found[n].append(pos)
+    for n, positions in found.items():
+        index.hits[n] = tuple(positions)
+
+
 def find_latest_batch_run_folder(batch_name: str) -> Path:
     """
     Finds the most recent folder matching batch_name_YYYY...
@@ -67,55 +199,63 @@ def find_latest_batch_run_folder(batch_name: str) -> Path:
 
 
 def load_json(path: Path) -> Any:
-    return json.loads(path.read_text(encoding="utf-8"))
+    if orjson:
+        return orjson.loads(path.read_bytes())
+    return json.loads(path.read_text("utf-8"))
 
 
-def normalize(s: str) -> str:
-    return re.sub(r"\s+", " ", (s or "").strip().lower())
+def dump_json(obj: Any) -> bytes:
+    # Same layout on both paths (2-space indent, non-ASCII kept); the pack files are read by people
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
 
 
-def url_matches_block(url: str, block_text: str) -> bool:
-    if not url:
-        return False
-    return url.lower() in block_text.lower()
+def normalize(s: str) -> str:
+    # split() drops leading/trailing whitespace and collapses inner runs, like re.sub(r"\s+", " ", ...)
+    return " ".join(s.split()).lower() if s else ""
 
 
-def title_token_score(title: str, block_text: str) -> int:
+def title_token_scores(title: str, index: BlockTextIndex) -> List[int]:
     """
-    Simple lexical overlap score: count meaningful title tokens found in the block.
+    Simple lexical overlap score per block: count meaningful title tokens found in the block.
+    Tokens still match as substrings of the block text (e.g. "work" in "workshop").
     """
+    scores = [0] * len(index.starts)
     t = (title or "").strip()
     if not t:
-        return 0
-    tokens = [w.lower() for w in re.findall(r"[A-Za-z0-9]+", t) if len(w) >= 4]
-    if not tokens:
-        return 0
-    bt = block_text.lower()
-    return sum(1 for tok in set(tokens) if tok in bt)
+        return scores
+    tokens = {w.lower() for w in TOKEN_RE.findall(t) if len(w) >= MIN_TITLE_TOKEN_LEN}
+    for tok in tokens:
+        for pos in blocks_containing(index, tok):
+            scores[pos] += 1
+    return scores
 
 
-def infer_event_source_email_index(event: Dict[str, Any], blocks: List[EmailBlock]) -> Tuple[Optional[int], float, str]:
+def infer_event_source_email_index(
+    event: Dict[str, Any], blocks: List[EmailBlock], block_index: Optional[BlockTextIndex] = None
+) -> Tuple[Optional[int], float, str]:
     """
     Try to infer which email block this event came from.
     Returns: (email_idx or None, confidence 0..1, method label)
     Priority:
       1) URL/Registration_URL/Meeting_URL exact inclusion
       2) Title token overlap
+    Pass a shared `block_index` (build_block_index) when linking many events of the same batch.
     """
     urls = []
-    for k in ["URL", "Registration_URL", "Meeting_URL"]:
+    for k in URL_FIELDS:
         v = (event.get(k) or "").strip()
         if v:
-            urls.append(v)
+            urls.append(v.lower())
 
     # 1) URL-based linking
-    url_hits: List[int] = []
-    for b in blocks:
-        for u in urls:
-            if url_matches_block(u, b.raw_block):
-                url_hits.append(b.idx)
-                break
-    url_hits_unique = sorted(set(url_hits))
+    if block_index is None:
+        block_index = build_block_index(blocks)
+    url_hits: set = set()
+    for u in urls:
+        url_hits.update(blocks[pos].idx for pos in blocks_containing(block_index, u))
+    url_hits_unique = sorted(url_hits)
     if len(url_hits_unique) == 1:
         return url_hits_unique[0], 0.95, "url_match"
     if len(url_hits_unique) > 1:
@@ -124,9 +264,12 @@ def infer_event_source_email_index(event: Dict[str, Any], blocks: List[EmailBloc
 
     # 2) Title-based linking
     title = event.get("Title") or ""
-    scores = [(b.idx, title_token_score(title, b.raw_block)) for b in blocks]
-    scores.sort(key=lambda x: x[1], reverse=True)
-    best_idx, best_score = scores[0]
+    scores = title_token_scores(title, block_index)
+    # max() keeps the first block among ties, like the stable descending sort did
+    best_pos = max(range(len(scores)), key=scores.__getitem__, default=None)
+    if best_pos is None:
+        return None, 0.0, "unlinked"
+    best_idx, best_score = blocks[best_pos].idx, scores[best_pos]
     if best_score >= 3:
         return best_idx, 0.75, "title_match_strong"
     if best_score == 2:
@@ -137,6 +280,16 @@ def infer_event_source_email_index(event: Dict[str, Any], blocks: List[EmailBloc
     return None, 0.0, "unlinked"
 
 
+def _empty_event_flags() -> Dict[str, bool]:
+    return {
+        "has_registration": False,
+        "has_meeting_url": False,
+        "has_location_tba": False,
+        "has_sub_event": False,
+        "has_main_event": False,
+    }
+
+
 def group_events_by_email(events: List[Dict[str, Any]], blocks: List[EmailBlock]) -> Dict[int, Dict[str, Any]]:
     """
     Build email-level summaries and link events to email blocks where possible.
@@ -150,48 +303,68 @@ def group_events_by_email(events: List[Dict[str, Any]], blocks: List[EmailBlock]
             "email_index": b.idx,
             "raw_block": b.raw_block,
             "events": [],
-            "link_confidences": [],
+            "has_event_cues": b.has_event_cues,
+            **_empty_event_flags(),
         }
         for b in blocks
     }
 
+    block_index = build_block_index(blocks)
+    prime_block_index(
+        block_index,
+        blocks,
+        {(ev.get(k) or "").strip().lower() for ev in events for k in URL_FIELDS},
+    )
+
+    # Bound append methods per email, so the event loop does no nested dict lookups
+    appenders = {idx: rec["events"].append for idx, rec in email_map.items()}
+    conf_sums: Dict[int, float] = {}  # running sum of link confidences per email
+    infer = infer_event_source_email_index
+
     for ev in events:
-        src_idx, conf, method = infer_event_source_email_index(ev, blocks)
+        src_idx, conf, method = infer(ev, blocks, block_index)
         ev_aug = dict(ev)
         ev_aug["_link_confidence"] = conf
         ev_aug["_link_method"] = method
 
-        if src_idx is not None and src_idx in email_map:
-            email_map[src_idx]["events"].append(ev_aug)
-            email_map[src_idx]["link_confidences"].append(conf)
-        else:
+        if src_idx is None or src_idx not in appenders:
             # keep unlinked events under a special bucket (-1)
-            email_map.setdefault(-1, {
-                "email_index": -1,
-                "raw_block": "",
-                "events": [],
-                "link_confidences": [],
-            })
-            email_map[-1]["events"].append(ev_aug)
-            email_map[-1]["link_confidences"].append(conf)
-
-    # compute flags
+            if -1 not in email_map:
+                email_map[-1] = {
+                    "email_index": -1,
+                    "raw_block": "",
+                    "events": [],
+                    "has_event_cues": False,
+                    **_empty_event_flags(),
+                }
+                appenders[-1] = email_map[-1]["events"].append
+            src_idx = -1
+
+        appenders[src_idx](ev_aug)
+        conf_sums[src_idx] = conf_sums.get(src_idx, 0.0) + conf
+
+        # flags derived from events, OR-ed in while linking (each check runs until its flag is set)
+        rec = email_map[src_idx]
+        if not rec["has_registration"] and ((ev.get("Registration_URL") or "").strip() or ev.get("Registration_Needed") is True):
+            rec["has_registration"] = True
+        if not rec["has_meeting_url"] and (ev.get("Meeting_URL") or "").strip():
+            rec["has_meeting_url"] = True
+        if not rec["has_location_tba"] and normalize(ev.get("Location") or "") == "location tba":
+            rec["has_location_tba"] = True
+        if not (rec["has_sub_event"] and rec["has_main_event"]):
+            event_type = (ev.get("Event_Type") or "").strip()
+            if event_type == "sub_event":
+                rec["has_sub_event"] = True
+            elif event_type == "main_event":
+                rec["has_main_event"] = True
+
+    # per-email totals
     for idx, rec in email_map.items():
-        evs = rec["events"]
-        rec["n_events"] = len(evs)
-        rec["avg_link_conf"] = (sum(rec["link_confidences"]) / len(rec["link_confidences"])) if rec["link_confidences"] else 0.0
-
-        # flags derived from events
-        rec["has_registration"] = any((e.get("Registration_URL") or "").strip() or (e.get("Registration_Needed") is True) for e in evs)
-        rec["has_meeting_url"] = any((e.get("Meeting_URL") or "").strip() for e in evs)
-        rec["has_location_tba"] = any(normalize(e.get("Location") or "") == "location tba" for e in evs)
-        rec["has_sub_event"] = any((e.get("Event_Type") or "").strip() == "sub_event" for e in evs)
-        rec["has_main_event"] = any((e.get("Event_Type") or "").strip() == "main_event" for e in evs)
-        rec["likely_newsletter"] = rec["n_events"] >= 3 or rec["has_sub_event"]
-
-        # cue-based borderline indicator for negatives (no events but cues exist)
-        raw = rec.get("raw_block") or ""
-        rec["has_event_cues"] = bool(EVENT_CUE_RE.search(raw))
+        n_events = len(rec["events"])
+        rec["n_events"] = n_events
+        rec["avg_link_conf"] = (conf_sums[idx] / n_events) if n_events else 0.0
+        rec["likely_newsletter"] = n_events >= 3 or rec["has_sub_event"]
+        # has_event_cues (borderline indicator for negatives) comes from parse_email_blocks
 
     return email_map
 
@@ -273,8 +446,9 @@ def select_five_per_batch(email_map: Dict[int, Dict[str, Any]]) -> List[Dict[str
             key=lambda x: (x["likely_newsletter"], x["n_events"], x["avg_link_conf"]),
             reverse=True,
         )
-        while len(chosen) < 5 and leftovers:
-            c = leftovers.pop(0)
+        for c in leftovers:
+            if len(chosen) >= 5:
+                break
             c["selection_reason"] = "fill_high_value_remaining"
             chosen.append(c); used.add(c["email_index"])
 
@@ -282,9 +456,9 @@ def select_five_per_batch(email_map: Dict[int, Dict[str, Any]]) -> List[Dict[str
 
 
 def save_excel_report(path: Path, rows: List[Dict[str, Any]]) -> None:
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "SelectionReport"
+    # write_only streams rows to disk instead of keeping every cell in memory
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("SelectionReport")
 
     headers = [
         "global_id",
@@ -299,10 +473,15 @@ def save_excel_report(path: Path, rows: List[Dict[str, Any]]) -> None:
         "has_sub_event",
         "avg_link_conf",
     ]
+
+    # Column widths (must be set before the first row in write-only mode)
+    for col_idx in range(1, len(headers) + 1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = 22
+
     ws.append(headers)
 
     for r in rows:
-        ws.append([
+        ws.append((
             r.get("global_id"),
             r.get("batch"),
             r.get("email_index"),
@@ -314,15 +493,36 @@ def save_excel_report(path: Path, rows: List[Dict[str, Any]]) -> None:
             r.get("has_location_tba"),
             r.get("has_sub_event"),
             round(float(r.get("avg_link_conf", 0.0)), 3),
-        ])
-
-    for col_idx in range(1, len(headers) + 1):
-        ws.column_dimensions[get_column_letter(col_idx)].width = 22
+        ))
 
     path.parent.mkdir(parents=True, exist_ok=True)
     wb.save(path)
 
 
+def process_batch(batch_name: str) -> Tuple[str, Path, List[Dict[str, Any]]]:
+    """
+    Load the latest prediction run of one batch, link its events to emails and pick the five emails.
+    Batches are independent, so main() runs this in worker processes.
+    Returns: (batch_name, run_dir, chosen email records)
+    """
+    run_dir = find_latest_batch_run_folder(batch_name)
+    input_path = run_dir / "input_sent_to_llm.txt"
+    events_path = run_dir / "events_filtered.json"
+
+    if not input_path.exists() or not events_path.exists():
+        raise FileNotFoundError(f"Missing required files in {run_dir} (need input_sent_to_llm.txt and events_filtered.json)")
+
+    batch_input = input_path.read_text(encoding="utf-8")
+    blocks = parse_email_blocks(batch_input)
+    events = load_json(events_path)
+    if not isinstance(events, list):
+        raise ValueError(f"events_filtered.json is not a list in {run_dir}")
+
+    email_map = group_events_by_email(events, blocks)
+    chosen = select_five_per_batch(email_map)
+    return batch_name, run_dir, chosen
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("--batches", type=str, default="batch_01,batch_02,batch_03,batch_04,batch_05")
@@ -346,58 +546,54 @@ def main() -> None:
 
     global_counter = 0
 
-    for batch_name in batch_names:
-        run_dir = find_latest_batch_run_folder(batch_name)
-        input_path = run_dir / "input_sent_to_llm.txt"
-        events_path = run_dir / "events_filtered.json"
-
-        if not input_path.exists() or not events_path.exists():
-            raise FileNotFoundError(f"Missing required files in {run_dir} (need input_sent_to_llm.txt and events_filtered.json)")
-
-        batch_input = input_path.read_text(encoding="utf-8")
-        blocks = parse_email_blocks(batch_input)
-        events = load_json(events_path)
-        if not isinstance(events, list):
-            raise ValueError(f"events_filtered.json is not a list in {run_dir}")
-
-        email_map = group_events_by_email(events, blocks)
-        chosen = select_five_per_batch(email_map)
-
-        selection_export["batches"][batch_name] = {
-            "run_dir": str(run_dir),
-            "chosen_email_indices": [c["email_index"] for c in chosen],
-        }
-
-        for c in chosen:
-            global_counter += 1
-            gid = f"email_{global_counter:03d}"
-            c["global_id"] = gid
-            c["batch"] = batch_name
-
-            # Write the email block text
-            email_txt = c["raw_block"]
-            (pack_dir / f"{gid}.txt").write_text(email_txt, encoding="utf-8")
-
-            # Write predictions for that email (the linked events)
-            # (Include link metadata so later evaluation can see confidence)
-            preds = []
-            for ev in c["events"]:
-                ev_out = {k: ev.get(k) for k in ev.keys() if not k.startswith("_")}
-                ev_out["_link_confidence"] = ev.get("_link_confidence")
-                ev_out["_link_method"] = ev.get("_link_method")
-                preds.append(ev_out)
-
-            (pack_dir / f"{gid}_pred.json").write_text(
-                json.dumps(preds, ensure_ascii=False, indent=2),
-                encoding="utf-8",
-            )
-
-            selection_rows.append(c)
+    # Select per batch in parallel; map() keeps batch order, so global ids stay deterministic
+    max_workers = max(1, min(len(batch_names), os.cpu_count() or 1))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(process_batch, batch_names))
+
+    # Pack files are written by a small thread pool so the file I/O overlaps
+    with ThreadPoolExecutor(max_workers=PACK_WRITE_WORKERS) as writer:
+        writes = []
+        for batch_name, run_dir, chosen in results:
+            selection_export["batches"][batch_name] = {
+                "run_dir": str(run_dir),
+                "chosen_email_indices": [c["email_index"] for c in chosen],
+            }
+
+            for c in chosen:
+                global_counter += 1
+                gid = f"email_{global_counter:03d}"
+                c["global_id"] = gid
+                c["batch"] = batch_name
+
+                # Write the email block text
+                email_txt = c["raw_block"]
+                writes.append(writer.submit(Path.write_bytes, pack_dir / f"{gid}.txt", email_txt.encode("utf-8")))
+
+                # Write predictions for that email (the linked events)
+                # (Include link metadata so later evaluation can see confidence)
+                preds = []
+                for ev in c["events"]:
+                    ev_out = {k: ev.get(k) for k in ev.keys() if not k.startswith("_")}
+                    ev_out["_link_confidence"] = ev.get("_link_confidence")
+                    ev_out["_link_method"] = ev.get("_link_method")
+                    preds.append(ev_out)
+
+                writes.append(writer.submit(
+                    Path.write_bytes,
+                    pack_dir / f"{gid}_pred.json",
+                    dump_json(preds),
+                ))
+
+                selection_rows.append(c)
+
+        # Surface write errors
+        for w in writes:
+            w.result()
 
     # Save selection manifest
-    (OUT_ROOT / "selection_25.json").write_text(
-        json.dumps(selection_export, ensure_ascii=False, indent=2),
-        encoding="utf-8",
+    (OUT_ROOT / "selection_25.json").write_bytes(
+        dump_json(selection_export)
     )
 
     # Save excel report